@@ -0,0 +1,202 @@
+from flask import Blueprint, Response, current_app, jsonify, request
+from sqlalchemy.orm import load_only, raiseload, selectinload
+from werkzeug.exceptions import BadRequest
+from conditional import make_etag, not_modified, set_validators
+from genres import filter_by_genres, requested_genres
+from models import Artist, Genre, Show, Venue, as_utc, utcnow
+from pagination import InvalidCursor, page_size, paginate
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+# JSON API for clients that fill a screen in one round trip.
+#
+#   GET /api/v1/venues?fields=id,name,genres,upcoming_shows&genre=Jazz
+#   GET /api/v1/venues?ids=4,1,9
+#   GET /api/v1/venues/1?fields=name,past_shows
+#
+# `fields` picks the attributes to return; columns that aren't asked for are
+# not loaded, and relationships that are come in with one selectinload query
+# each.  Every query runs with raiseload, so a field that would trigger a
+# per-row lazy load fails loudly instead of silently going N+1.  Without
+# `ids`, lists are keyset-paginated like the HTML pages.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Show.venues and Show.artists are backrefs, so they're looked up by name
+# once the mappers are configured.
+SHOW_COUNTERPARTS = {
+  Venue: ('artist', Artist),
+  Artist: ('venue', Venue),
+}
+
+RESOURCES = {
+  'venues': (Venue, [
+    'id', 'name', 'city', 'state', 'address', 'phone', 'website', 'facebook_link',
+    'seeking_talent', 'seeking_description', 'image_link', 'num_upcoming_shows', 'num_past_shows'],
+    ['id', 'name', 'city', 'state', 'num_upcoming_shows']),
+  'artists': (Artist, [
+    'id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+    'seeking_venue', 'seeking_description', 'image_link', 'num_upcoming_shows', 'num_past_shows'],
+    ['id', 'name', 'city', 'state', 'num_upcoming_shows']),
+}
+SHOW_FIELDS = ['id', 'start_time', 'end_time', 'venue_id', 'artist_id', 'venue', 'artist']
+RELATION_FIELDS = ['genres', 'upcoming_shows', 'past_shows']
+
+def json_response(payload):
+  if orjson is not None:
+    return Response(orjson.dumps(payload), mimetype='application/json')
+  return jsonify(payload)
+
+def requested_fields(allowed, default):
+  fields = request.args.get('fields')
+  if not fields:
+    return list(default)
+  fields = [field.strip() for field in fields.split(',') if field.strip()]
+  unknown = [field for field in fields if field not in allowed]
+  if unknown:
+    raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+  return fields
+
+def requested_ids():
+  try:
+    ids = [int(id) for id in request.args['ids'].split(',') if id.strip()]
+  except ValueError:
+    raise BadRequest('ids must be a comma-separated list of integers')
+  if len(ids) > current_app.config['PAGE_SIZE_MAX']:
+    raise BadRequest(f"At most {current_app.config['PAGE_SIZE_MAX']} ids per request")
+  return list(dict.fromkeys(ids))
+
+def entity_options(model, fields):
+  columns = [getattr(model, field) for field in fields if field not in RELATION_FIELDS]
+  options = [load_only(model.id, model.name, *columns, raiseload=True)]
+  if 'genres' in fields:
+    options.append(selectinload(model.genres).load_only(Genre.name, raiseload=True))
+  shows = {'upcoming_shows', 'past_shows'} & set(fields)
+  if shows:
+    now = utcnow()
+    relationship = model.shows
+    # Only one side asked for: load just those rows.
+    if shows == {'upcoming_shows'}:
+      relationship = relationship.and_(Show.start_time > now)
+    elif shows == {'past_shows'}:
+      relationship = relationship.and_(Show.start_time <= now)
+    counterpart_name, counterpart = SHOW_COUNTERPARTS[model]
+    options.append(selectinload(relationship)
+      .selectinload(getattr(Show, counterpart_name + 's'))
+      .load_only(counterpart.name, counterpart.image_link, raiseload=True))
+  options.append(raiseload('*'))
+  return options
+
+def serialize_show(show, counterpart_name):
+  counterpart = getattr(show, counterpart_name + 's')
+  return {
+    "id": show.id,
+    "start_time": as_utc(show.start_time).isoformat(),
+    counterpart_name + "_id": counterpart.id,
+    counterpart_name + "_name": counterpart.name,
+    counterpart_name + "_image_link": counterpart.image_link,
+  }
+
+def entity_serializer(model, fields):
+  counterpart_name = SHOW_COUNTERPARTS[model][0]
+  def serialize(entity):
+    data = {}
+    for field in fields:
+      if field == 'genres':
+        data[field] = [genre.name for genre in entity.genres]
+      elif field in ('upcoming_shows', 'past_shows'):
+        now = utcnow()
+        upcoming = field == 'upcoming_shows'
+        shows = [show for show in entity.shows if (as_utc(show.start_time) > now) == upcoming]
+        shows.sort(key=lambda show: show.start_time, reverse=not upcoming)
+        data[field] = [serialize_show(show, counterpart_name) for show in shows]
+      else:
+        data[field] = getattr(entity, field)
+    return data
+  return serialize
+
+def show_options(fields):
+  columns = [getattr(Show, field) for field in fields if field in ('start_time', 'end_time', 'venue_id', 'artist_id')]
+  options = [load_only(Show.id, Show.start_time, *columns, raiseload=True)]
+  for field, model in (('venue', Venue), ('artist', Artist)):
+    if field in fields:
+      options.append(selectinload(getattr(Show, field + 's')).load_only(model.name, model.image_link, raiseload=True))
+  options.append(raiseload('*'))
+  return options
+
+def show_serializer(fields):
+  def serialize(show):
+    data = {}
+    for field in fields:
+      if field in ('venue', 'artist'):
+        related = getattr(show, field + 's')
+        data[field] = {"id": related.id, "name": related.name, "image_link": related.image_link}
+      elif field in ('start_time', 'end_time'):
+        # SQLite hands back naive values; always emit the +00:00 offset.
+        data[field] = as_utc(getattr(show, field)).isoformat()
+      else:
+        data[field] = getattr(show, field)
+    return data
+  return serialize
+
+def respond(payload):
+  etag = make_etag('api', request.full_path, payload)
+  response = not_modified(etag)
+  if response is not None:
+    return response
+  return set_validators(json_response(payload), etag)
+
+def batch(model, options, serialize):
+  ids = requested_ids()
+  found = {entity.id: entity for entity in model.query.options(*options).filter(model.id.in_(ids))}
+  return respond({
+    "data": [serialize(found[id]) for id in ids if id in found],
+    "missing": [id for id in ids if id not in found],
+  })
+
+def listing(query, sort_columns, serialize):
+  per_page = page_size(request.args.get('per_page'), current_app.config['PAGE_SIZE_DEFAULT'], current_app.config['PAGE_SIZE_MAX'])
+  try:
+    page = paginate(query, sort_columns, per_page, after=request.args.get('after'), before=request.args.get('before'))
+  except InvalidCursor:
+    raise BadRequest('Invalid cursor')
+  return respond(page.to_dict(serialize))
+
+@api.route('/<any(venues, artists):resource>')
+def list_entities(resource):
+  model, columns, default = RESOURCES[resource]
+  fields = requested_fields(columns + RELATION_FIELDS, default)
+  options = entity_options(model, fields)
+  serialize = entity_serializer(model, fields)
+  if 'ids' in request.args:
+    return batch(model, options, serialize)
+  query = filter_by_genres(model.query.options(*options), model, requested_genres())
+  return listing(query, [model.name, model.id], serialize)
+
+@api.route('/<any(venues, artists):resource>/<int:entity_id>')
+def get_entity(resource, entity_id):
+  model, columns, default = RESOURCES[resource]
+  fields = requested_fields(columns + RELATION_FIELDS, default + RELATION_FIELDS)
+  entity = model.query.options(*entity_options(model, fields)).filter(model.id == entity_id).first_or_404()
+  return respond({"data": entity_serializer(model, fields)(entity)})
+
+@api.route('/shows')
+def list_shows():
+  fields = requested_fields(SHOW_FIELDS, SHOW_FIELDS)
+  options = show_options(fields)
+  serialize = show_serializer(fields)
+  if 'ids' in request.args:
+    return batch(Show, options, serialize)
+  return listing(Show.query.options(*options), [Show.start_time, Show.id], serialize)
+
+def api_error(error):
+  response = jsonify({"error": error.name, "message": error.description})
+  response.status_code = error.code
+  return response
+
+# By status code, so these win over the app's HTML error pages.
+for code in (400, 404, 405, 500):
+  api.register_error_handler(code, api_error)
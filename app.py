@@ -1,66 +1,155 @@
 import json
 import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Blueprint, Flask, current_app, render_template, request, Response, flash, redirect, url_for, jsonify, abort, stream_with_context, make_response
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from models import *
+from formatting import format_datetime
+from search import autocomplete, search_with_upcoming_shows
+from pagination import InvalidCursor, page_size, paginate, stream
+from areas import CITY, STATE, venues_by_area
+from genres import filter_by_genres, requested_genres
+from facets import ALL, DIMENSIONS, KINDS as FACET_KINDS, facet_breakdown, facet_count, facet_keys, genre_breakdown, refresh_facets_command, update_facets
+from bookings import BookingConflict, book, end_time_for, parse_tour, schedule_tour
+from counters import delete_venue_shows, recount_later, recount_shows_command, rollover_shows_command
+from cache import ResponseCache, artist_tag, venue_tag
+from conditional import artist_validators, conditional, make_etag, not_modified, set_validators, venue_validators
+from bulk import export_data_command, import_data_command
+from seed import seed_command
+from database import engine_options
+from routing import ReplicaRouter
+from api import api
+from tasks import tasks, worker_command
+from instrumentation import Instrumentation
+from assets import Assets, build_assets_command
+from templating import Templating
+from projections import artist_detail, venue_detail
 import sys
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+# Extensions are created unbound and attached in create_app(), so importing
+# this module (or models.py) opens no connections and touches no data.
+main = Blueprint('main', __name__)
+moment = Moment()
+response_cache = ResponseCache()
+replicas = ReplicaRouter()
+instrumentation = Instrumentation()
+assets = Assets()
+templating = Templating()
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+def wants_json():
+  if request.args.get('format') == 'json':
+    return True
+  return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
 
-app.jinja_env.filters['datetime'] = format_datetime
+def wants_stream():
+  return request.args.get('stream', current_app.config['STREAM_LISTINGS'], type=int) == 1
 
-@app.route('/')
+def stream_template(template_name, **context):
+  # Like render_template, but sends the page as it is rendered.  The
+  # request context stays open until the last chunk, so the rows can keep
+  # coming from the database cursor while the response is being written.
+  current_app.update_template_context(context)
+  template = current_app.jinja_env.get_template(template_name)
+  chunks = template.stream(context)
+  chunks.enable_buffering(current_app.config['STREAM_BUFFER_SIZE'])
+  return Response(stream_with_context(chunks))
+
+def requested_page_size():
+  return page_size(request.args.get('per_page'), current_app.config['PAGE_SIZE_DEFAULT'], current_app.config['PAGE_SIZE_MAX'])
+
+def listing_page(query, sort_columns):
+  try:
+    return paginate(query, sort_columns, requested_page_size(),
+      after=request.args.get('after'), before=request.args.get('before'))
+  except InvalidCursor:
+    abort(400)
+
+def render_listing(template_name, items_name, query, sort_columns, serialize, facets=None):
+  if wants_stream():
+    try:
+      rows = stream(query, sort_columns, current_app.config['STREAM_BATCH_SIZE'], after=request.args.get('after'))
+    except InvalidCursor:
+      abort(400)
+    return stream_template(template_name, **{items_name: rows, 'page': None, 'facets': facets})
+  page = listing_page(query, sort_columns)
+  return render_page(page, serialize, template_name, facets=facets, **{items_name: page.items})
+
+def render_page(page, serialize, template_name, facets=None, **context):
+  # The ETag is a hash of the page data, computed before rendering, so a
+  # revalidation that matches costs only the page query.
+  payload = page.to_dict(serialize)
+  if facets is not None:
+    payload['facets'] = facets
+  as_json = wants_json()
+  etag = make_etag('json' if as_json else 'html', payload)
+  response = not_modified(etag)
+  if response is not None:
+    return response
+  if as_json:
+    response = jsonify(payload)
+  else:
+    response = make_response(render_template(template_name, page=page, facets=facets, **context))
+  return set_validators(response, etag)
+
+def listing_item(row):
+  return {"id": row.id, "name": row.name}
+
+def show_listing_item(row):
+  # The *updated_at columns only key the tile cache; they stay out of the JSON.
+  return {"id": row.id, "start_time": as_utc(row.start_time).isoformat(), "venue_id": row.venue_id, "venue_name": row.venue_name,
+    "artist_id": row.artist_id, "artist_name": row.artist_name, "artist_image_link": row.artist_image_link}
+
+@main.route('/')
 def index():
   return render_template('pages/home.html')
 
-@app.route('/venues')
+@main.route('/venues')
 def venues():
-  venues = Venue.query.all()
-  return render_template('pages/venues.html', venues=venues)
+  genres = requested_genres()
+  try:
+    page = venues_by_area(requested_page_size(), current_app.config['AREA_VENUES_LIMIT'],
+      after=request.args.get('after'), before=request.args.get('before'), genres=genres)
+  except InvalidCursor:
+    abort(400)
+  return render_page(page, lambda area: area, 'pages/venues.html', facets=genre_breakdown('venues', genres), areas=page.items)
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/area/<state>/<city>')
+def venues_in_area(state, city):
+  genres = requested_genres()
+  query = filter_by_genres(Venue.query.filter(STATE == state, CITY == city), Venue, genres)
+  return render_listing('pages/venues_area.html', 'venues', query, [Venue.name, Venue.id], listing_item,
+    facets=genre_breakdown('venues', genres, state=state, city=city))
+
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
-  search_term = request.form.get('search_term')
-  data = []
-  venues = db.session.query(Venue).filter(Venue.name.ilike('%search_term%'))
-  for venue in venues:
-    num_upcoming_shows = 0
-    shows = db.session.query(Show).filter(Show.venue_id == venue.id)
-    for show in shows:
-      if (show.start_time > datetime.now()):
-        num_upcoming_shows += 1;
-    data.append({"id": venue.id, "name": venue.name, "num_upcoming_shows": num_upcoming_shows})
-  response = {"count": venues.count(), "data": data}
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term'))
-
-@app.route('/venues/<int:venue_id>')
+  search_term = request.form.get('search_term', '')
+  response = search_with_upcoming_shows(Venue, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], requested_genres())
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@main.route('/venues/autocomplete')
+def autocomplete_venues():
+  data = autocomplete(Venue, request.args.get('q', ''), current_app.config['SEARCH_AUTOCOMPLETE_LIMIT'])
+  return jsonify({"data": data})
+
+@main.route('/venues/<int:venue_id>')
+@conditional(venue_validators)
+@response_cache.cached(lambda venue_id: [venue_tag(venue_id)])
 def show_venue(venue_id):
-  data = Venue.query.get(venue_id)
+  data = venue_detail(venue_id)
+  if data is None:
+    abort(404)
+  response_cache.add_tags(*[artist_tag(show.artist_id) for show in data.upcoming_shows + data.past_shows])
   return render_template('pages/show_venue.html', venue=data)
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   form = VenueForm()
   error = False
@@ -69,12 +158,14 @@ def create_venue_submission():
   state = request.form.get('state')
   address = request.form.get('address')
   phone = request.form.get('phone')
-  genres = request.form.get('genres')
+  genres = request.form.getlist('genres')
   facebook_link = request.form.get('facebook_link')
   try:
-    venue = Venue(name=name, city = city, state = state,address = address, phone = phone, genres = [genres],facebook_link = facebook_link)
+    venue = Venue(name=name, city = city, state = state,address = address, phone = phone, genres = Genre.named(genres),facebook_link = facebook_link)
     db.session.add(venue)
+    update_facets(after=facet_keys(venue))
     db.session.commit()
+    venue_id = venue.id
   except:
     error = True
     db.session.rollback()
@@ -85,71 +176,89 @@ def create_venue_submission():
   if error:
     abort (400)
   else:
+    response_cache.invalidate(venue_tag(venue_id))
     flash('Venue ' + request.form.get('name') + ' was successfully listed!')
     return render_template('pages/home.html')
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
+  error = False
   try:
-    Venue.query.filter_by(id=venue).delete()
+    venue = db.session.get(Venue, venue_id)
+    if venue is not None:
+      update_facets(before=facet_keys(venue))
+    delete_venue_shows(venue_id)
+    db.session.execute(venue_genres.delete().where(venue_genres.c.venue_id == venue_id))
+    Venue.query.filter_by(id=venue_id).delete()
     db.session.commit()
   except:
+    error = True
     db.session.rollback()
+    print(sys.exc_info())
   finally:
     db.session.close()
-  return None
+  if error:
+    abort (400)
+  else:
+    response_cache.invalidate(venue_tag(venue_id))
+    return '', 204
 
-@app.route('/artists')
+@main.route('/artists')
 def artists():
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  genres = requested_genres()
+  query = filter_by_genres(Artist.query, Artist, genres)
+  return render_listing('pages/artists.html', 'artists', query, [Artist.name, Artist.id], listing_item,
+    facets=genre_breakdown('artists', genres))
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
-  search_term = request.form.get('search_term')
-  data = []
-  artists = db.session.query(Artist).filter(Artist.name.ilike('%search_term%'))
-  for artist in artists:
-    num_upcoming_shows = 0
-    shows = db.session.query(Show).filter(Show.artist_id == artist.id)
-    for show in shows:
-      if (show.start_time > datetime.now()):
-        num_upcoming_shows += 1;
-    data.append({"id": artist.id, "name": artist.name, "num_upcoming_shows": num_upcoming_shows})
-  response = {"count": artists.count(), "data": data}
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term'))
-
-@app.route('/artists/<int:artist_id>')
+  search_term = request.form.get('search_term', '')
+  response = search_with_upcoming_shows(Artist, search_term, current_app.config['SEARCH_RESULTS_LIMIT'], requested_genres())
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@main.route('/artists/autocomplete')
+def autocomplete_artists():
+  data = autocomplete(Artist, request.args.get('q', ''), current_app.config['SEARCH_AUTOCOMPLETE_LIMIT'])
+  return jsonify({"data": data})
+
+@main.route('/artists/<int:artist_id>')
+@conditional(artist_validators)
+@response_cache.cached(lambda artist_id: [artist_tag(artist_id)])
 def show_artist(artist_id):
-  data = Artist.query.get(artist_id)
+  data = artist_detail(artist_id)
+  if data is None:
+    abort(404)
+  response_cache.add_tags(*[venue_tag(show.venue_id) for show in data.upcoming_shows + data.past_shows])
   return render_template('pages/show_artist.html', artist=data)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
   artist = Artist.query.get(artist_id)
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   form = ArtistForm()
   error = False
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.get_or_404(artist_id)
   name = request.form.get('name')
   city = request.form.get('city')
   state = request.form.get('state')
   address = request.form.get('address')
   phone = request.form.get('phone')
-  genres = request.form.get('genres')
+  genres = request.form.getlist('genres')
   facebook_link = request.form.get('facebook_link')
   try:
-    artist.name = 'name'
-    artist.city = 'city'
-    artist.state = 'state'
-    artist.address = 'address'
-    artist.phone = 'phone'
-    artist.genres = 'genres'
-    artist.facebook_link = 'facebook_link'
+    before = facet_keys(artist)
+    artist.name = name
+    artist.city = city
+    artist.state = state
+    artist.address = address
+    artist.phone = phone
+    artist.genres = Genre.named(genres)
+    artist.facebook_link = facebook_link
+    update_facets(before, facet_keys(artist))
     db.session.commit()
   except:
     error = True
@@ -160,34 +269,37 @@ def edit_artist_submission(artist_id):
   if error:
     abort (400)
   else:
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    response_cache.invalidate(artist_tag(artist_id))
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
   venue = Venue.query.get(venue_id)
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   form = VenueForm()
   error = False
-  venue = ArtVenueist.query.get(venue_id)
+  venue = Venue.query.get_or_404(venue_id)
   name = request.form.get('name')
   city = request.form.get('city')
   state = request.form.get('state')
   address = request.form.get('address')
   phone = request.form.get('phone')
-  genres = request.form.get('genres')
+  genres = request.form.getlist('genres')
   facebook_link = request.form.get('facebook_link')
   try:
-    venue.name = 'name'
-    venue.city = 'city'
-    venue.state = 'state'
-    venue.address = 'address'
-    venue.phone = 'phone'
-    venue.genres = 'genres'
-    venue.facebook_link = 'facebook_link'
+    before = facet_keys(venue)
+    venue.name = name
+    venue.city = city
+    venue.state = state
+    venue.address = address
+    venue.phone = phone
+    venue.genres = Genre.named(genres)
+    venue.facebook_link = facebook_link
+    update_facets(before, facet_keys(venue))
     db.session.commit()
   except:
     error = True
@@ -198,14 +310,15 @@ def edit_venue_submission(venue_id):
   if error:
     abort (400)
   else:
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    response_cache.invalidate(venue_tag(venue_id))
+    return redirect(url_for('main.show_venue', venue_id=venue_id))
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   form = ArtistForm()
   error = False
@@ -214,11 +327,12 @@ def create_artist_submission():
   state = request.form.get('state')
   address = request.form.get('address')
   phone = request.form.get('phone')
-  genres = request.form.get('genres')
+  genres = request.form.getlist('genres')
   facebook_link = request.form.get('facebook_link')
   try:
-    artist = Artist(name=name, city = city, state = state,address = address, phone = phone, genres = [genres],facebook_link = facebook_link)
+    artist = Artist(name=name, city = city, state = state,address = address, phone = phone, genres = Genre.named(genres),facebook_link = facebook_link)
     db.session.add(artist)
+    update_facets(after=facet_keys(artist))
     db.session.commit()
   except:
     error = True
@@ -233,27 +347,48 @@ def create_artist_submission():
     flash('Artist ' + request.form.get('name') + ' was successfully listed!')
     return render_template('pages/home.html')
 
-@app.route('/shows')
+@main.route('/shows')
 def shows():
-  data = Show.query.all()
-  return render_template('pages/shows.html', shows=data)
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link'),
+      Show.updated_at,
+      Venue.updated_at.label('venue_updated_at'),
+      Artist.updated_at.label('artist_updated_at')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+  return render_listing('pages/shows.html', 'shows', query, [Show.start_time, Show.id], show_listing_item)
 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
   form = ShowForm()
   error = False
   venue_id = request.form.get('venue_id')
   artist_id = request.form.get('artist_id')
   start_time = request.form.get('start_time')
+  duration = request.form.get('duration', type=int)
   try:
-    show = Show(venue_id = venue_id, artist_id = artist_id, start_time = start_time)
-    db.session.add(show)
+    start_time = as_utc(dateutil.parser.parse(start_time))
+    show = Show(venue_id = venue_id, artist_id = artist_id, start_time = start_time, end_time = end_time_for(start_time, duration))
+    book(show)
+    recount_later([show.venue_id], [show.artist_id])
     db.session.commit()
+  except BookingConflict as conflict:
+    db.session.rollback()
+    db.session.close()
+    for other in conflict.shows:
+      flash(f'Conflicts with show {other.id} (venue {other.venue_id}, artist {other.artist_id}), '
+        f'{format_datetime(other.start_time)} to {format_datetime(other.end_time)}.')
+    return render_template('forms/new_show.html', form=form), 409
   except:
     error = True
     db.session.rollback()
@@ -264,26 +399,116 @@ def create_show_submission():
   if error:
     abort (400)
   else:
+    response_cache.invalidate(venue_tag(venue_id), artist_tag(artist_id))
     flash('Show was successfully listed!')
     return render_template('pages/home.html')
 
-@app.errorhandler(404)
+@main.route('/shows/batch')
+def create_show_batch():
+  form = ShowBatchForm()
+  return render_template('forms/new_show_batch.html', form=form)
+
+@main.route('/shows/batch', methods=['POST'])
+def create_show_batch_submission():
+  # Form posts carry one show per line; JSON posts look like
+  # {"artist_id": 1, "shows": [{"venue_id": 2, "start_time": "...", "duration": 90}]}
+  form = ShowBatchForm()
+  payload = request.get_json(silent=True) if request.is_json else None
+  if payload is not None:
+    artist_id, rows = payload.get('artist_id'), payload.get('shows')
+  else:
+    artist_id, rows = request.form.get('artist_id'), parse_tour(request.form.get('shows', ''))
+  def bad_request(message):
+    if payload is not None:
+      return jsonify({"error": message}), 400
+    abort(400)
+  if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+    return bad_request('Needs a non-empty list of shows.')
+  if len(rows) > current_app.config['SHOW_BATCH_MAX']:
+    return bad_request(f"At most {current_app.config['SHOW_BATCH_MAX']} shows per batch.")
+  try:
+    results = schedule_tour(int(artist_id), rows)
+    db.session.commit()
+  except LookupError as error:
+    db.session.rollback()
+    return bad_request(str(error))
+  except (TypeError, ValueError):
+    db.session.rollback()
+    return bad_request('Needs an integer artist_id.')
+  except BookingConflict:
+    db.session.rollback()
+    if payload is not None:
+      return jsonify({"error": "A concurrent booking overlaps this batch; nothing was scheduled."}), 409
+    flash('A concurrent booking overlaps this batch; nothing was scheduled. Please resubmit.')
+    return render_template('forms/new_show_batch.html', form=form), 409
+  finally:
+    db.session.close()
+  created = [result for result in results if result['status'] == 'created']
+  if created:
+    response_cache.invalidate(artist_tag(artist_id), *{venue_tag(result['venue_id']) for result in created})
+  if payload is not None or wants_json():
+    return jsonify({"created": len(created), "rejected": len(results) - len(created), "results": results})
+  flash(f'{len(created)} of {len(results)} shows were listed.')
+  return render_template('forms/new_show_batch.html', form=form, results=results)
+
+@main.route('/facets/<kind>')
+def facet_counts(kind):
+  # e.g. /facets/venues?genre=Jazz&state=CA&by=city
+  if kind not in FACET_KINDS:
+    abort(404)
+  fixed = {name: request.args.get(name, ALL) for name in DIMENSIONS}
+  data = {"count": facet_count(kind, **fixed)}
+  by = request.args.get('by')
+  if by in DIMENSIONS:
+    data["by"] = facet_breakdown(kind, by, **fixed)
+  return jsonify(data)
+
+@main.route('/cache/stats')
+def cache_stats():
+  return jsonify(response_cache.stats())
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+def create_app(config=None):
+  app = Flask(__name__)
+  app.config.from_object('config')
+  if config:
+    app.config.update(config)
+  app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+  db.init_app(app)
+  replicas.init_app(app)
+  migrate.init_app(app, db)
+  moment.init_app(app)
+  response_cache.init_app(app)
+  tasks.init_app(app)
+  instrumentation.init_app(app)
+  assets.init_app(app)
+  templating.init_app(app)
+  app.register_blueprint(main)
+  app.register_blueprint(api)
+  for command in (seed_command, rollover_shows_command, recount_shows_command, import_data_command, export_data_command,
+      refresh_facets_command, worker_command, build_assets_command):
+    app.cli.add_command(command)
+
+  app.jinja_env.filters['datetime'] = format_datetime
+
+  if not app.debug:
+      file_handler = FileHandler('error.log')
+      file_handler.setFormatter(
+          Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+      )
+      app.logger.setLevel(logging.INFO)
+      file_handler.setLevel(logging.INFO)
+      app.logger.addHandler(file_handler)
+      app.logger.info('errors')
+
+  return app
 
 if __name__ == '__main__':
-    app.run()
\ No newline at end of file
+    create_app().run()
@@ -0,0 +1,96 @@
+from itertools import groupby
+from sqlalchemy import func, true, tuple_
+from models import db, Venue
+from pagination import KeysetPage, decode_cursor, encode_cursor
+from genres import with_genre
+
+# Venues grouped by (state, city).
+#
+# One statement pages through the areas on the venues(state, city, ...)
+# index, counts each area's venues, and returns at most `venues_per_area`
+# venues per area with their denormalized upcoming-show counts.  The rows
+# come back already ordered by area, so grouping them afterwards never needs
+# more than one page of data in memory.
+#
+# A missing state or city groups as '', as in facets.py, so those venues get
+# an area of their own and its key can go in a cursor.
+
+STATE = func.coalesce(Venue.state, '')
+CITY = func.coalesce(Venue.city, '')
+AREA_COLUMNS = [STATE, CITY]
+
+def area_cursor(area):
+  return encode_cursor([area['state'], area['city']])
+
+def venues_by_area(per_page, venues_per_area, after=None, before=None, genres=()):
+  area_key = tuple_(*AREA_COLUMNS)
+  # Both the area page and the venues in it only count matching venues.
+  matching = Venue.id.in_(with_genre(Venue, genres)) if genres else true()
+  areas = (db.session.query(
+      STATE.label('state'),
+      CITY.label('city'),
+      func.count(Venue.id).label('venue_count'))
+    .filter(matching)
+    .group_by(STATE, CITY))
+  if before:
+    areas = (areas.filter(area_key < tuple_(*decode_cursor(before, AREA_COLUMNS)))
+      .order_by(STATE.desc(), CITY.desc()))
+  else:
+    if after:
+      areas = areas.filter(area_key > tuple_(*decode_cursor(after, AREA_COLUMNS)))
+    areas = areas.order_by(STATE, CITY)
+  areas = areas.limit(per_page + 1).cte('areas')
+
+  position = func.row_number().over(
+    partition_by=(STATE, CITY),
+    order_by=(Venue.name, Venue.id))
+  ranked = (db.session.query(
+      Venue.id,
+      Venue.name,
+      STATE.label('state'),
+      CITY.label('city'),
+      Venue.num_upcoming_shows,
+      position.label('position'))
+    .join(areas, (STATE == areas.c.state) & (CITY == areas.c.city))
+    .filter(matching)
+    .subquery())
+
+  # Driven by the area rows, so every area on the page comes back even if
+  # none of its venues does.
+  rows = (db.session.query(
+      areas.c.state,
+      areas.c.city,
+      areas.c.venue_count,
+      ranked.c.id,
+      ranked.c.name,
+      ranked.c.num_upcoming_shows)
+    .outerjoin(ranked, (ranked.c.state == areas.c.state) & (ranked.c.city == areas.c.city)
+      & (ranked.c.position <= venues_per_area))
+    .order_by(areas.c.state, areas.c.city, ranked.c.position)
+    .all())
+
+  items = []
+  for (state, city), venues in groupby(rows, key=lambda row: (row.state, row.city)):
+    venues = list(venues)
+    items.append({
+      "state": state,
+      "city": city,
+      "venue_count": venues[0].venue_count,
+      "venues": [{"id": venue.id, "name": venue.name, "num_upcoming_shows": venue.num_upcoming_shows}
+        for venue in venues if venue.id is not None],
+    })
+
+  has_more = len(items) > per_page
+  if before:
+    items = items[1:] if has_more else items
+    return KeysetPage(
+      items,
+      next_cursor=area_cursor(items[-1]) if items else None,
+      prev_cursor=area_cursor(items[0]) if items and has_more else None,
+      per_page=per_page)
+  items = items[:per_page]
+  return KeysetPage(
+    items,
+    next_cursor=area_cursor(items[-1]) if items and has_more else None,
+    prev_cursor=area_cursor(items[0]) if items and after else None,
+    per_page=per_page)
@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import rcssmin
+except ImportError:
+  rcssmin = None
+
+try:
+  import rjsmin
+except ImportError:
+  rjsmin = None
+
+# Fingerprinted, precompressed static assets.
+#
+# `flask build-assets` writes everything under static/ into static/dist/ with
+# a content hash in the file name (css/main.css -> css/main.3f9c0a1b2d4e.css),
+# concatenates and minifies the BUNDLES the layout links, and stores .gz (and
+# .br, when the brotli package is installed) next to each text file.
+# dist/manifest.json maps the original paths to the hashed ones.
+#
+# Templates link assets through asset_url() and bundle_urls().  With a
+# manifest they point at /static/dist/..., served with the best encoding the
+# client accepts and `Cache-Control: immutable`, so a repeat visit makes no
+# asset requests at all until a deploy changes a hash.  Without one (a fresh
+# checkout, development) they fall back to the plain files under /static.
+
+BUNDLES = {
+  # Head, render-blocking: modernizr has to set its classes before the body.
+  'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+  # End of body, deferred; in the order the layout used to run them.
+  'js/site.js': ['js/libs/jquery-1.11.1.min.js', 'js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+  'css/site.css': ['css/bootstrap.min.css', 'css/main.css', 'css/main.responsive.css'],
+}
+
+COMPRESSIBLE = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.ico', '.eot', '.otf', '.ttf'}
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+class Assets:
+  def __init__(self, app=None):
+    self.manifest = {}
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('ASSETS_ENABLED', True)
+    app.extensions['assets'] = self
+    self.manifest = load_manifest(app) if app.config['ASSETS_ENABLED'] else {}
+    app.add_url_rule(f'{app.static_url_path}/{DIST}/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals.update(asset_url=asset_url, bundle_urls=bundle_urls)
+
+def dist_folder(app):
+  return os.path.join(app.static_folder, DIST)
+
+def load_manifest(app):
+  try:
+    with open(os.path.join(dist_folder(app), MANIFEST)) as file:
+      return json.load(file)
+  except FileNotFoundError:
+    return {}
+
+def asset_url(path):
+  hashed = current_app.extensions['assets'].manifest.get(path)
+  if hashed is None:
+    return url_for('static', filename=path)
+  return url_for('assets', filename=hashed)
+
+def bundle_urls(name):
+  # One URL once built, the individual sources until then.
+  if name in current_app.extensions['assets'].manifest:
+    return [asset_url(name)]
+  return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+def serve_asset(filename):
+  if filename == MANIFEST:
+    abort(404)
+  folder = dist_folder(current_app)
+  mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+  for encoding, suffix in ENCODINGS:
+    if request.accept_encodings[encoding] and os.path.isfile(os.path.join(folder, filename + suffix)):
+      response = send_from_directory(folder, filename + suffix, mimetype=mimetype)
+      response.headers['Content-Encoding'] = encoding
+      break
+  else:
+    encoding = None
+    response = send_from_directory(folder, filename, mimetype=mimetype)
+  if encoding is not None or os.path.splitext(filename)[1] in COMPRESSIBLE:
+    response.vary.add('Accept-Encoding')
+  response.headers['Cache-Control'] = IMMUTABLE
+  return response
+
+def fingerprint(path, content):
+  root, ext = posixpath.splitext(path)
+  return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+def minify_css(text):
+  if rcssmin is not None:
+    return rcssmin.cssmin(text)
+  # Comments out and whitespace collapsed, leaving strings alone.  Spaces
+  # around ':' and '+' stay: they're significant in selectors and calc().
+  parts = []
+  for index, part in enumerate(CSS_TOKENS.split(text)):
+    if index % 2:
+      if not part.startswith('/*'):
+        parts.append(part)
+      elif part.startswith('/*!'):
+        parts.append(part + '\n')
+    else:
+      part = re.sub(r'\s+', ' ', part)
+      if parts and parts[-1][-1:] in ('{', '}', ';', ',', '>', '\n'):
+        part = part.lstrip()
+      parts.append(re.sub(r'\s*([{};,>])\s*', r'\1', part).replace(';}', '}'))
+  return ''.join(parts).strip()
+
+def minify_js(text):
+  # Without rjsmin the sources go in as they are; the large ones are
+  # already minified and gzip takes care of most of the rest.
+  text = SOURCE_MAP.sub('', text)
+  return rjsmin.jsmin(text) if rjsmin is not None else text
+
+def rewrite_urls(css, source, bundle, manifest):
+  # Relative url()s point at the hashed copies, relative to the bundle.
+  def replace(match):
+    url = match.group(2).strip()
+    if re.match(r'^(?:[a-z]+:|/|#)', url, re.I):
+      return match.group(0)
+    path, rest = re.match(r'([^?#]*)(.*)', url).groups()
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+    hashed = manifest.get(target)
+    if hashed is None:
+      return match.group(0)
+    return f'url("{posixpath.relpath(hashed, posixpath.dirname(bundle))}{rest}")'
+  return CSS_URL.sub(replace, css)
+
+def compress(path):
+  with open(path, 'rb') as file:
+    content = file.read()
+  written = []
+  variants = [('.gz', gzip.compress(content, 9, mtime=0))]
+  if brotli is not None:
+    variants.append(('.br', brotli.compress(content, quality=11)))
+  for suffix, data in variants:
+    if len(data) < len(content):
+      with open(path + suffix, 'wb') as file:
+        file.write(data)
+      written.append((suffix, len(data)))
+  return written
+
+def write(dist, path, content):
+  target = os.path.join(dist, *path.split('/'))
+  os.makedirs(os.path.dirname(target), exist_ok=True)
+  with open(target, 'wb') as file:
+    file.write(content)
+  return target
+
+def build(app):
+  # Yields (path, size, variants) per file written.  Earlier builds stay in
+  # dist/, so pages still cached by clients or proxies during a deploy can
+  # load what they link.
+  static = app.static_folder
+  dist = dist_folder(app)
+  manifest = {}
+  outputs = []
+  for directory, subdirectories, files in os.walk(static):
+    if os.path.abspath(directory) == os.path.abspath(static) and DIST in subdirectories:
+      subdirectories.remove(DIST)
+    for name in sorted(files):
+      path = os.path.relpath(os.path.join(directory, name), static).replace(os.sep, '/')
+      with open(os.path.join(directory, name), 'rb') as file:
+        content = file.read()
+      manifest[path] = fingerprint(path, content)
+      outputs.append((manifest[path], content))
+  for bundle, sources in BUNDLES.items():
+    texts = []
+    for source in sources:
+      with open(os.path.join(static, *source.split('/')), encoding='utf-8') as file:
+        text = file.read()
+      if bundle.endswith('.css'):
+        texts.append(minify_css(rewrite_urls(text, source, bundle, manifest)))
+      else:
+        texts.append(minify_js(text).strip())
+    # A line of its own between scripts: one may end in a // comment or
+    # without its final semicolon.
+    content = ('\n' if bundle.endswith('.css') else '\n;\n').join(texts).encode('utf-8') + b'\n'
+    manifest[bundle] = fingerprint(bundle, content)
+    outputs.append((manifest[bundle], content))
+  for path, content in outputs:
+    target = write(dist, path, content)
+    variants = compress(target) if posixpath.splitext(path)[1] in COMPRESSIBLE else []
+    yield path, len(content), variants
+  # Last, so a running process never sees names it can't serve yet.
+  write(dist, MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+  app.extensions['assets'].manifest = manifest
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+  """Fingerprint, bundle and precompress static/ into static/dist/."""
+  for path, size, variants in build(current_app):
+    sizes = ''.join(f'  {suffix} {length:,d}' for suffix, length in variants)
+    click.echo(f'{path:<60} {size:>9,d}{sizes}')
+  if brotli is None:
+    click.echo('brotli is not installed; wrote gzip variants only')
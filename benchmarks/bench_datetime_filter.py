@@ -0,0 +1,58 @@
+"""Microbenchmark for the `datetime` template filter.
+
+Formats 10k show timestamps the way /shows renders them and compares the
+original dateutil + babel.dates.format_datetime path with formatting.py.
+
+    python -m benchmarks.bench_datetime_filter [--rows 10000] [--distinct 500]
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+
+import formatting
+
+def baseline_format(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def make_rows(rows, distinct, seed=0):
+  rng = random.Random(seed)
+  start = datetime(2020, 1, 1, 20, tzinfo=timezone.utc)
+  values = [(start + timedelta(days=i, minutes=30 * (i % 4))).isoformat() for i in range(distinct)]
+  return [rng.choice(values) for _ in range(rows)]
+
+def run(label, format_fn, rows, repeat):
+  def render():
+    for value in rows:
+      format_fn(value, 'full')
+  best = min(timeit.repeat(render, number=1, repeat=repeat))
+  print(f'{label:<12} {best * 1000:9.1f} ms per {len(rows)} rows')
+  return best
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--rows', type=int, default=10000)
+  parser.add_argument('--distinct', type=int, default=500)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  rows = make_rows(args.rows, args.distinct)
+  assert all(baseline_format(value, 'full') == formatting.format_datetime(value, 'full') for value in set(rows))
+
+  baseline = run('baseline', baseline_format, rows, args.repeat)
+  formatting.parse_datetime.cache_clear()
+  formatting.format_parsed.cache_clear()
+  cold = run('cold cache', formatting.format_datetime, rows, 1)
+  warm = run('warm cache', formatting.format_datetime, rows, args.repeat)
+  print(f'speedup      {baseline / cold:9.1f}x cold, {baseline / warm:.1f}x warm')
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,73 @@
+"""Where reads go with replica routing enabled.
+
+Points the app at a primary and two replicas, one of which is unreachable,
+then counts the statements each database receives for a run of GETs, for
+GETs right after a POST from the same client, and for the POST itself.
+Defaults to three SQLite files; pass --primary/--replica to use two local
+PostgreSQL instances instead.
+
+    python -m benchmarks.bench_replica_routing [--requests 200]
+"""
+import argparse
+import os
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--requests', type=int, default=200)
+  parser.add_argument('--primary')
+  parser.add_argument('--replica')
+  args = parser.parse_args()
+
+  from app import create_app
+  from models import db, Artist, Show, Venue
+
+  workdir = tempfile.mkdtemp()
+  primary = args.primary or 'sqlite:///' + os.path.join(workdir, 'primary.db')
+  replica = args.replica or 'sqlite:///' + os.path.join(workdir, 'replica.db')
+  unreachable = 'sqlite:///' + os.path.join(workdir, 'missing', 'replica.db')
+  app = create_app({
+    'SQLALCHEMY_DATABASE_URI': primary,
+    'SQLALCHEMY_REPLICA_URIS': [replica, unreachable],
+    'WTF_CSRF_ENABLED': False,
+    'RESPONSE_CACHE_BACKEND': None,
+  })
+
+  with app.app_context():
+    names = {id(db.engine): 'primary'}
+    names.update(zip(map(id, app.extensions['replicas'].engines()), ['replica', 'unreachable']))
+    engines = [db.engine] + app.extensions['replicas'].engines()[:1]
+    # Stand-in for replication: same schema and rows on both.
+    for engine in engines:
+      db.metadata.create_all(engine)
+      with engine.begin() as connection:
+        connection.execute(Venue.__table__.insert(), [{"id": 1, "name": "Hall", "city": "SF", "state": "CA"}])
+        connection.execute(Artist.__table__.insert(), [{"id": 1, "name": "Band", "city": "SF", "state": "CA"}])
+
+  statements = Counter()
+  for engine in engines:
+    event.listen(engine, 'before_cursor_execute',
+      lambda conn, *rest: statements.update([names[id(conn.engine)]]))
+
+  def run(label, requests):
+    statements.clear()
+    for request in requests:
+      request()
+    print(f'{label:<28} ' + '  '.join(f'{name} {statements[name]:5d}' for name in ('primary', 'replica')))
+
+  client = app.test_client()
+  paths = ['/artists', '/venues', '/shows', '/venues/1', '/artists/1']
+  gets = [lambda path=path: client.get(path) for path in paths] * (args.requests // len(paths))
+  start_time = (datetime.now(timezone.utc) + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+  run('GET, no recent write', gets)
+  run('POST /shows/create', [lambda: client.post('/shows/create', data={'venue_id': '1', 'artist_id': '1', 'start_time': start_time})])
+  run('GET, within write window', gets)
+  with app.app_context():
+    assert db.session.query(Show).count() == 1
+
+if __name__ == '__main__':
+  main()
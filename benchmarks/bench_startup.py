@@ -0,0 +1,60 @@
+"""Startup cost of the application factory.
+
+Starts fresh interpreters that import app.py and call create_app(), and
+reports the time taken, the number of SQLAlchemy engines and the number of
+database connections opened.  Importing must open no connection and leave
+the data alone; one request-sized query should open exactly one.
+
+    python -m benchmarks.bench_startup [--runs 5] [--database-uri sqlite://]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+def child(database_uri):
+  from sqlalchemy import event, select
+  from sqlalchemy.pool import Pool
+  connections = []
+  event.listen(Pool, 'connect', lambda *args: connections.append(1))
+
+  started = time.perf_counter()
+  from app import create_app
+  from models import db
+  app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri})
+  elapsed = time.perf_counter() - started
+
+  with app.app_context():
+    engines = len(db.engines)
+    at_startup = len(connections)
+    db.session.execute(select(1))
+    after_query = len(connections)
+  print(json.dumps({
+    "seconds": elapsed, "engines": engines,
+    "connections_at_startup": at_startup, "connections_after_query": after_query}))
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--runs', type=int, default=5)
+  parser.add_argument('--database-uri', default='sqlite://')
+  parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.child:
+    return child(args.database_uri)
+
+  results = []
+  for _ in range(args.runs):
+    output = subprocess.run(
+      [sys.executable, '-m', 'benchmarks.bench_startup', '--child', '--database-uri', args.database_uri],
+      check=True, capture_output=True, text=True).stdout
+    results.append(json.loads(output.splitlines()[-1]))
+  last = results[-1]
+  print(f"startup      {statistics.median(r['seconds'] for r in results) * 1000:9.1f} ms (median of {args.runs})")
+  print(f"engines      {last['engines']:9d}")
+  print(f"connections  {last['connections_at_startup']:9d} at startup, {last['connections_after_query']} after one query")
+  assert last['engines'] == 1 and last['connections_at_startup'] == 0 and last['connections_after_query'] == 1
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,166 @@
+"""Deterministic synthetic catalog for the load benchmarks.
+
+Fills a database with venues, artists and shows through the bulk loader's
+insert path (COPY on PostgreSQL, batched INSERT elsewhere), then rebuilds
+the show counters and facet counts.  The same --seed, --size and --anchor
+always produce the same rows.  Shows never overlap: they go out in blocks
+of min(venues, artists) at one start time, each block a day after the
+previous, centred on --anchor so half are past and half upcoming.
+
+    python -m benchmarks.datagen --database-uri sqlite:////tmp/fyyur-bench.db --size small
+    python -m benchmarks.datagen --database-uri postgresql://localhost/fyyur_bench --size large
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+from sqlalchemy import text
+
+SIZES = {
+  'tiny': (200, 400, 2000),
+  'small': (1000, 2000, 20000),
+  'medium': (10000, 20000, 500000),
+  'large': (100000, 200000, 5000000),
+}
+
+CITIES = [
+  ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('Oakland', 'CA'), ('New York', 'NY'), ('Brooklyn', 'NY'),
+  ('Austin', 'TX'), ('Houston', 'TX'), ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'),
+  ('Nashville', 'TN'), ('Memphis', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'), ('Boston', 'MA'),
+  ('Atlanta', 'GA'), ('Detroit', 'MI'), ('Minneapolis', 'MN'), ('Philadelphia', 'PA'), ('Miami', 'FL'),
+]
+ADJECTIVES = ['Blue', 'Golden', 'Velvet', 'Electric', 'Silver', 'Crimson', 'Hidden', 'Lucky', 'Wild', 'Midnight',
+  'Rusty', 'Neon', 'Painted', 'Broken', 'Royal', 'Little', 'Copper', 'Lonesome', 'Sunset', 'Iron']
+NOUNS = ['Room', 'Hall', 'Lounge', 'Tavern', 'Garden', 'Cellar', 'Palace', 'Attic', 'Barn', 'Theatre',
+  'Club', 'House', 'Parlor', 'Den', 'Yard', 'Ballroom', 'Saloon', 'Stage', 'Loft', 'Pavilion']
+BANDS = ['Wolves', 'Saints', 'Ramblers', 'Echoes', 'Pilots', 'Strangers', 'Sparrows', 'Outlaws', 'Ghosts', 'Drifters',
+  'Kings', 'Sisters', 'Machines', 'Rivers', 'Foxes', 'Owls', 'Preachers', 'Satellites', 'Thieves', 'Hearts']
+
+SLOT = timedelta(days=1)
+
+def pick_genres(rng, names):
+  return rng.sample(names, rng.randint(1, 3))
+
+def venue_rows(count, rng, genre_names):
+  for id in range(1, count + 1):
+    city, state = CITIES[rng.randrange(len(CITIES))]
+    yield {
+      "id": id, "name": f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {id}', "city": city, "state": state,
+      "address": f'{rng.randint(1, 9999)} {rng.choice(NOUNS)} St', "phone": f'{rng.randint(200, 999)}-555-{rng.randint(0, 9999):04d}',
+      "image_link": f'https://img.example.com/venues/{id}.jpg', "facebook_link": f'https://www.facebook.com/venue{id}',
+      "website": f'https://venue{id}.example.com', "seeking_talent": rng.random() < 0.3,
+      "seeking_description": 'Looking for local acts' if rng.random() < 0.3 else None,
+      "genres": pick_genres(rng, genre_names),
+    }
+
+def artist_rows(count, rng, genre_names):
+  for id in range(1, count + 1):
+    city, state = CITIES[rng.randrange(len(CITIES))]
+    yield {
+      "id": id, "name": f'{rng.choice(ADJECTIVES)} {rng.choice(BANDS)} {id}', "city": city, "state": state,
+      "address": None, "phone": f'{rng.randint(200, 999)}-555-{rng.randint(0, 9999):04d}',
+      "image_link": f'https://img.example.com/artists/{id}.jpg', "facebook_link": f'https://www.facebook.com/artist{id}',
+      "website": None, "seeking_venue": rng.random() < 0.3,
+      "seeking_description": 'Touring this summer' if rng.random() < 0.3 else None,
+      "genres": pick_genres(rng, genre_names),
+    }
+
+def show_rows(count, venues, artists, anchor, rng):
+  block = min(venues, artists)
+  first = anchor - SLOT * (count // block // 2)
+  venue_offset = artist_offset = 0
+  for id in range(1, count + 1):
+    index = (id - 1) % block
+    if index == 0:
+      # A new start time; shuffle who plays where by rotating both sides.
+      venue_offset, artist_offset = rng.randrange(venues), rng.randrange(artists)
+    start_time = first + SLOT * ((id - 1) // block)
+    yield {
+      "id": id, "venue_id": (venue_offset + index) % venues + 1, "artist_id": (artist_offset + index) % artists + 1,
+      "start_time": start_time, "end_time": start_time + timedelta(hours=2),
+    }
+
+def chunks(rows, size):
+  rows = iter(rows)
+  while True:
+    chunk = list(islice(rows, size))
+    if not chunk:
+      return
+    yield chunk
+
+def load(kind, table, rows, chunk_size, link=None):
+  from bulk import insert_chunk
+  from models import db
+  started = time.perf_counter()
+  total = 0
+  columns = [column.name for column in table.columns if column.name not in ('updated_at', 'num_past_shows', 'num_upcoming_shows')]
+  for chunk in chunks(rows, chunk_size):
+    insert_chunk(table, columns, [{column: row.get(column) for column in columns} for row in chunk])
+    if link is not None:
+      link_table, owner_column, genre_ids = link
+      insert_chunk(link_table, [owner_column, 'genre_id'],
+        [{owner_column: row['id'], 'genre_id': genre_ids[name]} for row in chunk for name in row['genres']])
+    db.session.commit()
+    total += len(chunk)
+  elapsed = time.perf_counter() - started
+  print(f'{kind:<8} {total:>10,d} rows  {elapsed:8.1f}s  {total / elapsed:>10,.0f} rows/s')
+
+def generate(venues, artists, shows, seed=0, anchor=None, chunk_size=10000):
+  from counters import recount_shows
+  from facets import rebuild_facets
+  from forms import GENRE_CHOICES
+  from models import db, Artist, Genre, Show, Venue, artist_genres, venue_genres
+  from seed import clear_data
+  anchor = anchor or datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+  rng = random.Random(seed)
+  clear_data(db.session)
+  db.session.commit()
+  genre_names = [name for name, _ in GENRE_CHOICES]
+  genres = Genre.named(genre_names)
+  db.session.add_all(genres)
+  db.session.commit()
+  genre_ids = {genre.name: genre.id for genre in genres}
+  load('venues', Venue.__table__, venue_rows(venues, rng, genre_names), chunk_size, (venue_genres, 'venue_id', genre_ids))
+  load('artists', Artist.__table__, artist_rows(artists, rng, genre_names), chunk_size, (artist_genres, 'artist_id', genre_ids))
+  load('shows', Show.__table__, show_rows(shows, venues, artists, anchor, rng), chunk_size)
+  if db.session.get_bind().dialect.name == 'postgresql':
+    from bulk import reset_sequence
+    for model in (Venue, Artist, Show):
+      reset_sequence(model)
+    db.session.commit()
+  started = time.perf_counter()
+  recount_shows()
+  rebuild_facets()
+  db.session.commit()
+  print(f'counters and facets rebuilt in {time.perf_counter() - started:.1f}s')
+  # Fresh statistics, so the planner sees the sizes being measured.
+  with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+    connection.execute(text('ANALYZE'))
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--database-uri', required=True)
+  parser.add_argument('--size', choices=list(SIZES), default='small')
+  parser.add_argument('--venues', type=int)
+  parser.add_argument('--artists', type=int)
+  parser.add_argument('--shows', type=int)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--anchor', type=lambda value: datetime.fromisoformat(value).replace(tzinfo=timezone.utc),
+    help='Midpoint of the show calendar (default: today, 00:00 UTC).')
+  parser.add_argument('--chunk-size', type=int, default=10000)
+  args = parser.parse_args()
+
+  from flask_migrate import upgrade
+  from app import create_app
+  venues, artists, shows = SIZES[args.size]
+  app = create_app({'SQLALCHEMY_DATABASE_URI': args.database_uri, 'TASKS_BACKEND': 'inline'})
+  with app.app_context():
+    # Through the migrations, so PostgreSQL gets the search indexes too.
+    upgrade(directory=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations'))
+    generate(args.venues or venues, args.artists or artists, args.shows or shows, args.seed, args.anchor, args.chunk_size)
+
+if __name__ == '__main__':
+  main()
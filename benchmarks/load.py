@@ -0,0 +1,257 @@
+"""Load driver covering every route.
+
+Runs each scenario below against a catalog made by benchmarks.datagen,
+in-process through the Flask test client (so it measures the app and the
+database, not a web server), and reports p50/p95/p99 latency, throughput
+and SQL statements per request.  Requests are drawn from a seeded RNG, so
+two runs against the same catalog issue the same requests.
+
+    python -m benchmarks.load --database-uri sqlite:////tmp/fyyur-bench.db
+    python -m benchmarks.load --database-uri ... --save benchmarks/baselines/sqlite-small.json
+    python -m benchmarks.load --database-uri ... --compare benchmarks/baselines/sqlite-small.json
+
+With --compare, a route regresses when it issues more statements per
+request, or fails more requests, than the baseline; the exit status is 1 if
+any route regressed.  Those counts don't depend on the machine, so the
+committed baselines gate every run.  Latencies do: --latency also flags a
+p95 that grew by more than --tolerance (and by more than a millisecond),
+which only means something against a baseline saved on the same machine.
+Regenerate the catalog before each run, since the create and edit routes
+change it.
+"""
+import argparse
+import fnmatch
+import itertools
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, func, select
+
+from benchmarks.datagen import ADJECTIVES, BANDS, CITIES
+
+FAR_FUTURE = datetime(2090, 1, 1, 20, tzinfo=timezone.utc)
+
+class Catalog:
+  # What the scenarios need to know about the data, read once up front.
+  def __init__(self, db, Venue, Artist):
+    self.max_venue = db.session.scalar(select(func.max(Venue.id))) or 1
+    self.max_artist = db.session.scalar(select(func.max(Artist.id))) or 1
+    self.created_venues = []
+    self.slots = itertools.count()
+
+  def slot(self):
+    # Far-future start times no other request uses, so creates never clash.
+    return FAR_FUTURE + timedelta(hours=3 * next(self.slots))
+
+def venue_form(rng, name):
+  city, state = rng.choice(CITIES)
+  return {"name": name, "city": city, "state": state, "address": '1 Bench St', "phone": '415-555-0100',
+    "genres": ['Jazz', 'Folk'], "facebook_link": 'https://www.facebook.com/bench'}
+
+def artist_form(rng, name):
+  city, state = rng.choice(CITIES)
+  return {"name": name, "city": city, "state": state, "phone": '415-555-0101',
+    "genres": ['Rock n Roll'], "facebook_link": 'https://www.facebook.com/bench'}
+
+def scenarios(catalog):
+  # name -> (expected status, request builder(rng) -> (method, path, kwargs))
+  venue = lambda rng: rng.randint(1, catalog.max_venue)
+  artist = lambda rng: rng.randint(1, catalog.max_artist)
+
+  def create_venue(rng):
+    return 'POST', '/venues/create', {"data": venue_form(rng, f'Bench Venue {rng.random():.12f}')}
+
+  def delete_venue(rng):
+    # Throwaway venues made up front by create_venues().
+    return 'DELETE', f'/venues/{catalog.created_venues.pop()}', {}
+
+  def create_show(rng):
+    return 'POST', '/shows/create', {"data": {"venue_id": venue(rng), "artist_id": artist(rng),
+      "start_time": catalog.slot().strftime('%Y-%m-%d %H:%M:%S')}}
+
+  def show_batch(rng):
+    return 'POST', '/shows/batch', {"json": {"artist_id": artist(rng), "shows": [
+      {"venue_id": venue(rng), "start_time": catalog.slot().isoformat()} for _ in range(50)]}}
+
+  return {
+    'home': (200, lambda rng: ('GET', '/', {})),
+    'venues': (200, lambda rng: ('GET', '/venues', {})),
+    'venues_genre': (200, lambda rng: ('GET', '/venues?genre=' + rng.choice(['Jazz', 'Folk', 'Soul']), {})),
+    'venues_area': (200, lambda rng: ('GET', '/venues/area/{1}/{0}'.format(*rng.choice(CITIES)), {})),
+    'venue_detail': (200, lambda rng: ('GET', f'/venues/{venue(rng)}', {})),
+    'venue_search': (200, lambda rng: ('POST', '/venues/search', {"data": {"search_term": rng.choice(ADJECTIVES)}})),
+    'venue_autocomplete': (200, lambda rng: ('GET', '/venues/autocomplete?q=' + rng.choice(ADJECTIVES)[:3], {})),
+    'venue_create_form': (200, lambda rng: ('GET', '/venues/create', {})),
+    'venue_create': (200, create_venue),
+    'venue_edit_form': (200, lambda rng: ('GET', f'/venues/{venue(rng)}/edit', {})),
+    'venue_edit': (302, lambda rng: ('POST', f'/venues/{venue(rng)}/edit', {"data": venue_form(rng, f'Edited Venue {venue(rng)}')})),
+    'venue_delete': (204, delete_venue),
+    'artists': (200, lambda rng: ('GET', '/artists', {})),
+    'artist_detail': (200, lambda rng: ('GET', f'/artists/{artist(rng)}', {})),
+    'artist_search': (200, lambda rng: ('POST', '/artists/search', {"data": {"search_term": rng.choice(BANDS)}})),
+    'artist_autocomplete': (200, lambda rng: ('GET', '/artists/autocomplete?q=' + rng.choice(ADJECTIVES)[:3], {})),
+    'artist_create_form': (200, lambda rng: ('GET', '/artists/create', {})),
+    'artist_create': (200, lambda rng: ('POST', '/artists/create', {"data": artist_form(rng, f'Bench Artist {rng.random():.12f}')})),
+    'artist_edit_form': (200, lambda rng: ('GET', f'/artists/{artist(rng)}/edit', {})),
+    'artist_edit': (302, lambda rng: ('POST', f'/artists/{artist(rng)}/edit', {"data": artist_form(rng, f'Edited Artist {artist(rng)}')})),
+    'shows': (200, lambda rng: ('GET', '/shows', {})),
+    'show_create_form': (200, lambda rng: ('GET', '/shows/create', {})),
+    'show_create': (200, create_show),
+    'show_batch_form': (200, lambda rng: ('GET', '/shows/batch', {})),
+    'show_batch': (200, show_batch),
+    'facets': (200, lambda rng: ('GET', '/facets/venues?state=CA&by=city', {})),
+    'api_venues': (200, lambda rng: ('GET', '/api/v1/venues?fields=id,name,genres,upcoming_shows', {})),
+    'api_venue_batch': (200, lambda rng: ('GET', '/api/v1/venues?ids=' + ','.join(str(venue(rng)) for _ in range(50)), {})),
+    'api_artist': (200, lambda rng: ('GET', f'/api/v1/artists/{artist(rng)}', {})),
+    'api_shows': (200, lambda rng: ('GET', '/api/v1/shows?fields=id,start_time,venue,artist', {})),
+  }
+
+class StatementCounter:
+  def __init__(self, engines):
+    self.local = threading.local()
+    for engine in engines:
+      event.listen(engine, 'before_cursor_execute', self.count)
+
+  def count(self, *args):
+    self.local.count = getattr(self.local, 'count', 0) + 1
+
+  def take(self):
+    count = getattr(self.local, 'count', 0)
+    self.local.count = 0
+    return count
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def run_scenario(app, counter, name, expected, build, requests, concurrency, seed):
+  # Requests are built up front so every run issues the same ones,
+  # whatever order the threads pick them up in.
+  rng = random.Random(f'{seed}:{name}')
+  planned = [build(rng) for _ in range(requests)]
+  samples = []
+  errors = []
+  local = threading.local()
+
+  def one(request):
+    if not hasattr(local, 'client'):
+      local.client = app.test_client()
+    method, path, kwargs = request
+    counter.take()
+    started = time.perf_counter()
+    response = local.client.open(path, method=method, **kwargs)
+    elapsed = time.perf_counter() - started
+    response.close()
+    samples.append((elapsed, counter.take()))
+    if response.status_code != expected:
+      errors.append(f'{method} {path} -> {response.status_code}')
+
+  started = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    list(pool.map(one, planned))
+  wall = time.perf_counter() - started
+  latencies = [sample[0] for sample in samples]
+  return {
+    "requests": len(samples),
+    "p50_ms": percentile(latencies, 0.50) * 1000,
+    "p95_ms": percentile(latencies, 0.95) * 1000,
+    "p99_ms": percentile(latencies, 0.99) * 1000,
+    "rps": len(samples) / wall,
+    "statements": statistics.mean(sample[1] for sample in samples),
+    "errors": len(errors),
+  }, errors[:3]
+
+def compare(results, baseline, tolerance=None):
+  # tolerance=None leaves latency out of it.
+  regressions = []
+  for name, result in results.items():
+    before = baseline['routes'].get(name)
+    if before is None:
+      continue
+    grew = result['p95_ms'] - before['p95_ms']
+    if tolerance is not None and grew > before['p95_ms'] * tolerance and grew > 1:
+      regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+    if result['statements'] > before['statements'] + 0.5:
+      regressions.append(f"{name}: statements/request {before['statements']:.1f} -> {result['statements']:.1f}")
+    if result['errors'] > before.get('errors', 0):
+      regressions.append(f"{name}: errors {before.get('errors', 0)} -> {result['errors']}")
+  return regressions
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--database-uri', required=True)
+  parser.add_argument('--requests', type=int, default=200, help='Measured requests per route.')
+  parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per route first.')
+  parser.add_argument('--concurrency', type=int, default=1)
+  parser.add_argument('--routes', default='*', help='Glob over route names, e.g. "venue*".')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--cache', action='store_true', help='Keep the response cache on (off by default).')
+  parser.add_argument('--save', metavar='PATH', help='Write the results here as a baseline.')
+  parser.add_argument('--compare', metavar='PATH', help='Baseline to check the results against.')
+  parser.add_argument('--latency', action='store_true',
+    help='Also compare p95 latency; only meaningful with a baseline saved on this machine.')
+  parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 growth with --latency.')
+  args = parser.parse_args()
+
+  from app import create_app
+  from models import db, Artist, Venue
+  app = create_app({
+    'SQLALCHEMY_DATABASE_URI': args.database_uri,
+    'WTF_CSRF_ENABLED': False,
+    'RESPONSE_CACHE_BACKEND': 'memory' if args.cache else None,
+    'TASKS_BACKEND': 'inline',
+  })
+  app.logger.disabled = True
+  with app.app_context():
+    catalog = Catalog(db, Venue, Artist)
+    counter = StatementCounter([db.engine] + app.extensions['replicas'].engines())
+    dialect = db.engine.dialect.name
+
+  results = {}
+  print(f"{'route':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'stmts':>6} {'errors':>6}")
+  for name, (expected, build) in scenarios(catalog).items():
+    if not fnmatch.fnmatch(name, args.routes):
+      continue
+    if name == 'venue_delete' and len(catalog.created_venues) < args.warmup + args.requests:
+      # Deletes need venues to delete; make them without measuring.
+      with app.app_context():
+        catalog.created_venues.extend(create_venues(db, Venue, args.warmup + args.requests - len(catalog.created_venues)))
+    if args.warmup:
+      run_scenario(app, counter, name + ':warmup', expected, build, args.warmup, args.concurrency, args.seed)
+    results[name], errors = run_scenario(app, counter, name, expected, build, args.requests, args.concurrency, args.seed)
+    result = results[name]
+    print(f"{name:<20} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} "
+      f"{result['rps']:8.0f} {result['statements']:6.1f} {result['errors']:6d}")
+    for error in errors:
+      print(f'  {error}')
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump({"meta": {"dialect": dialect, "venues": catalog.max_venue, "artists": catalog.max_artist,
+        "requests": args.requests, "concurrency": args.concurrency}, "routes": results}, f, indent=2, sort_keys=True)
+      f.write('\n')
+  if args.compare:
+    with open(args.compare) as f:
+      regressions = compare(results, json.load(f), args.tolerance if args.latency else None)
+    for regression in regressions:
+      print(f'REGRESSION {regression}')
+    if regressions:
+      sys.exit(1)
+
+def create_venues(db, Venue, count):
+  from facets import facet_keys, update_facets
+  venues = [Venue(name=f'Doomed Venue {i}', city='Nowhere', state='CA') for i in range(count)]
+  db.session.add_all(venues)
+  for venue in venues:
+    update_facets(after=facet_keys(venue))
+  db.session.commit()
+  return [venue.id for venue in venues]
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,182 @@
+from datetime import timedelta
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from counters import recount_later
+from formatting import parse_datetime
+from models import db, MAX_SHOW_DURATION, DEFAULT_SHOW_DURATION, Artist, Show, Venue, as_utc
+
+# Double-booking checks for new shows.
+#
+# A show occupies [start_time, end_time).  Because no show runs longer than
+# MAX_SHOW_DURATION, anything that overlaps a new show starts within
+# MAX_SHOW_DURATION before its end, so the lookup is a bounded range scan
+# of ix_shows_venue_id_start_time / ix_shows_artist_id_start_time rather
+# than a walk over the venue's whole history.
+#
+# On PostgreSQL the exclusion constraints on shows are what actually keep
+# concurrent bookings apart: the losing INSERT fails with an exclusion
+# violation.  Elsewhere the check runs after the INSERT has been flushed,
+# when the transaction already holds the database's write lock, so a racing
+# booking either committed first (and is seen) or has to wait for ours.
+#
+# schedule_tour() does the same for a batch of dates for one artist: one IN
+# query for the venues, one windowed query for everything the batch could
+# overlap and a single multi-row INSERT; the show counters of the venues
+# and the artist are recounted by a job after the commit.
+
+EXCLUSION_VIOLATION = '23P01'
+
+class BookingConflict(Exception):
+  def __init__(self, shows):
+    super().__init__(f'Overlaps {len(shows)} existing show(s)')
+    self.shows = shows
+
+def end_time_for(start_time, duration_minutes=None):
+  duration = DEFAULT_SHOW_DURATION if duration_minutes is None else timedelta(minutes=duration_minutes)
+  if duration <= timedelta(0) or duration > MAX_SHOW_DURATION:
+    raise ValueError(f'Duration must be between 1 minute and {MAX_SHOW_DURATION}')
+  return start_time + duration
+
+def overlapping(venue_id, artist_id, start_time, end_time, exclude_id=None):
+  start_time, end_time = as_utc(start_time), as_utc(end_time)
+  query = Show.query.filter(
+    or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+    Show.start_time > start_time - MAX_SHOW_DURATION,
+    Show.start_time < end_time,
+    Show.end_time > start_time)
+  if exclude_id is not None:
+    query = query.filter(Show.id != exclude_id)
+  return query.order_by(Show.start_time).all()
+
+def is_overlap(error):
+  orig = error.orig
+  return (getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)) == EXCLUSION_VIOLATION
+
+def book(show):
+  # Adds and flushes the show; raises BookingConflict, with the session
+  # rolled back, if it overlaps another show of its venue or artist.
+  db.session.add(show)
+  try:
+    db.session.flush()
+  except IntegrityError as error:
+    if not is_overlap(error):
+      raise
+    db.session.rollback()
+    conflict(overlapping(show.venue_id, show.artist_id, show.start_time, show.end_time))
+  conflicts = overlapping(show.venue_id, show.artist_id, show.start_time, show.end_time, exclude_id=show.id)
+  if conflicts:
+    conflict(conflicts)
+
+def conflict(shows):
+  # Detached first, so the rows stay readable after the rollback.
+  for show in shows:
+    db.session.expunge(show)
+  db.session.rollback()
+  raise BookingConflict(shows)
+
+def overlaps(a, b):
+  return a['start_time'] < b['end_time'] and b['start_time'] < a['end_time']
+
+def parse_tour(text):
+  # One date per line: "venue_id, start_time[, duration in minutes]".
+  rows = []
+  for line in text.splitlines():
+    if line.strip():
+      rows.append(dict(zip(('venue_id', 'start_time', 'duration'), [part.strip() for part in line.split(',', 2)])))
+  return rows
+
+def tour_record(artist_id, row):
+  duration = row.get('duration')
+  start_time = row['start_time']
+  if not isinstance(start_time, str):
+    raise TypeError(start_time)
+  start_time = as_utc(parse_datetime(start_time))
+  return {
+    "venue_id": int(row['venue_id']),
+    "artist_id": artist_id,
+    "start_time": start_time,
+    "end_time": end_time_for(start_time, int(duration) if duration not in (None, '') else None),
+  }
+
+def existing_shows(artist_id, records, exclude_ids=()):
+  # Everything any record could overlap, bucketed by venue and by artist.
+  query = (select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+    .where(
+      or_(Show.artist_id == artist_id, Show.venue_id.in_({record['venue_id'] for record in records})),
+      Show.start_time > min(record['start_time'] for record in records) - MAX_SHOW_DURATION,
+      Show.start_time < max(record['end_time'] for record in records),
+      Show.end_time > min(record['start_time'] for record in records)))
+  if exclude_ids:
+    query = query.where(Show.id.notin_(exclude_ids))
+  buckets = {}
+  for show in db.session.execute(query).mappings():
+    show = dict(show, start_time=as_utc(show['start_time']), end_time=as_utc(show['end_time']))
+    if show['artist_id'] == artist_id:
+      buckets.setdefault(('artist', artist_id), []).append(show)
+    buckets.setdefault(('venue', show['venue_id']), []).append(show)
+  return buckets
+
+def clashes(record, buckets):
+  seen = {}
+  for key in (('artist', record['artist_id']), ('venue', record['venue_id'])):
+    for show in buckets.get(key, ()):
+      if overlaps(record, show):
+        seen[show['id']] = show
+  return list(seen.values())
+
+def schedule_tour(artist_id, rows):
+  # Returns one result dict per row, in order; rows that pass every check
+  # are inserted in the current transaction, which the caller commits.
+  # Raises LookupError for an unknown artist and BookingConflict if a
+  # concurrent booking got in between the check and the insert.
+  if db.session.get(Artist, artist_id) is None:
+    raise LookupError(f'No artist with id {artist_id}')
+  results = [{"row": index, "venue_id": row.get('venue_id'), "start_time": row.get('start_time'), "status": "rejected", "errors": []}
+    for index, row in enumerate(rows)]
+  records = {}
+  for index, row in enumerate(rows):
+    try:
+      records[index] = tour_record(artist_id, row)
+    except (KeyError, TypeError, ValueError, OverflowError):
+      results[index]['errors'].append('Needs a venue id, a start time and an optional duration of 1 to '
+        f'{int(MAX_SHOW_DURATION.total_seconds() // 60)} minutes')
+  venue_ids = {record['venue_id'] for record in records.values()}
+  known = set(db.session.scalars(select(Venue.id).where(Venue.id.in_(venue_ids)))) if venue_ids else set()
+  for index, record in list(records.items()):
+    if record['venue_id'] not in known:
+      results[index]['errors'].append(f"No venue with id {record['venue_id']}")
+      del records[index]
+  buckets = existing_shows(artist_id, list(records.values())) if records else {}
+  accepted = []
+  # Every row is for the same artist, so in start order a row can only
+  # overlap the batch through the last one accepted before it.
+  for index in sorted(records, key=lambda index: records[index]['start_time']):
+    record = records[index]
+    for show in clashes(record, buckets):
+      results[index]['errors'].append(f"Overlaps show {show['id']} (venue {show['venue_id']}, artist {show['artist_id']})")
+    if accepted and overlaps(record, records[accepted[-1]]):
+      results[index]['errors'].append(f'Overlaps row {accepted[-1]} of this batch')
+    if not results[index]['errors']:
+      accepted.append(index)
+  if not accepted:
+    return results
+  batch = [records[index] for index in accepted]
+  try:
+    # Accepted rows never overlap, so start_time alone tells this artist's
+    # rows apart; an unordered RETURNING keeps it to one statement.
+    inserted = db.session.execute(insert(Show).returning(Show.id, Show.start_time), batch).all()
+  except IntegrityError as error:
+    if not is_overlap(error):
+      raise
+    db.session.rollback()
+    raise BookingConflict([])
+  ids = {as_utc(start_time): id for id, start_time in inserted}
+  others = existing_shows(artist_id, batch, exclude_ids=list(ids.values()))
+  if any(clashes(record, others) for record in batch):
+    db.session.rollback()
+    raise BookingConflict([])
+  recount_later(venue_ids=[record['venue_id'] for record in batch], artist_ids=[artist_id])
+  for index in accepted:
+    record = records[index]
+    results[index].update(status='created', id=ids[as_utc(record['start_time'])], venue_id=record['venue_id'], start_time=record['start_time'].isoformat())
+  return results
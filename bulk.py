@@ -0,0 +1,321 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, text
+from werkzeug.datastructures import MultiDict
+from counters import recount_shows
+from facets import rebuild_facets
+from formatting import parse_datetime
+from forms import ArtistForm, ShowForm, VenueForm
+from bookings import end_time_for
+from models import db, Artist, Genre, Show, Venue, artist_genres, as_utc, venue_genres
+
+# Bulk import/export of partner catalogs.
+#
+# Files are read and written as a stream of chunks, so memory depends on
+# --chunk-size rather than on the file.  Every row is checked with the same
+# WTForms rules as the create forms; show rows may point at venues and
+# artists by id or by exact name, resolved with one IN query per chunk.
+# On PostgreSQL each chunk is loaded with COPY, elsewhere with a batched
+# executemany INSERT.  Ids are assigned before loading so that genre links
+# go in with their chunk.  Show counters and facet counts are rebuilt once at
+# the end rather than per row.
+
+KINDS = {
+  'venues': (Venue, VenueForm, [
+    'id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+    'facebook_link', 'website', 'seeking_talent', 'seeking_description']),
+  'artists': (Artist, ArtistForm, [
+    'id', 'name', 'city', 'state', 'address', 'phone', 'image_link',
+    'facebook_link', 'website', 'seeking_venue', 'seeking_description']),
+  'shows': (Show, ShowForm, ['id', 'venue_id', 'artist_id', 'start_time', 'end_time']),
+}
+
+GENRE_LINKS = {
+  'venues': (venue_genres, 'venue_id'),
+  'artists': (artist_genres, 'artist_id'),
+}
+
+BOOLEAN_COLUMNS = ('seeking_talent', 'seeking_venue')
+INTEGER_COLUMNS = ('id', 'venue_id', 'artist_id')
+
+def file_format(path, requested):
+  if requested:
+    return requested
+  return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def read_rows(path, fmt):
+  with open(path, newline='', encoding='utf-8') as f:
+    if fmt == 'csv':
+      yield from csv.DictReader(f)
+    else:
+      for line in f:
+        if line.strip():
+          yield json.loads(line)
+
+def chunked(rows, size):
+  rows = iter(rows)
+  while True:
+    chunk = list(islice(rows, size))
+    if not chunk:
+      return
+    yield chunk
+
+def genre_list(value):
+  if value is None or value == '':
+    return []
+  if isinstance(value, list):
+    return value
+  return [genre.strip() for genre in value.split(';') if genre.strip()]
+
+def form_errors(form_class, row):
+  formdata = MultiDict()
+  for key, value in row.items():
+    if isinstance(value, list):
+      for item in value:
+        formdata.add(key, item)
+    elif value is not None:
+      formdata.add(key, str(value))
+  form = form_class(formdata=formdata, meta={'csrf': False})
+  return None if form.validate() else form.errors
+
+def normalize(kind, row):
+  row = {key: value for key, value in row.items() if value not in (None, '')}
+  if 'genres' in row:
+    row['genres'] = genre_list(row['genres'])
+  if kind == 'shows' and 'start_time' in row:
+    # ShowForm only accepts '%Y-%m-%d %H:%M:%S'; partner files use ISO 8601.
+    try:
+      start_time = as_utc(parse_datetime(str(row['start_time'])))
+      row['start_time'] = start_time.strftime('%Y-%m-%d %H:%M:%S')
+      row['_start_time'] = start_time
+    except (ValueError, OverflowError):
+      pass
+  if kind == 'shows' and '_start_time' in row:
+    # An explicit end_time wins over a duration in minutes; neither means
+    # the default slot.  Either way it must fit MAX_SHOW_DURATION.
+    try:
+      if 'end_time' in row:
+        end_time = as_utc(parse_datetime(str(row['end_time'])))
+        end_time_for(row['_start_time'], (end_time - row['_start_time']).total_seconds() / 60)
+      else:
+        end_time = end_time_for(row['_start_time'], int(row['duration']) if 'duration' in row else None)
+      row['_end_time'] = end_time
+    except (ValueError, OverflowError) as e:
+      row.setdefault('_errors', {})['end_time'] = [str(e)]
+  return row
+
+def to_record(kind, columns, row):
+  record = {}
+  for column in columns:
+    value = row.get(column)
+    if column in ('start_time', 'end_time'):
+      value = row['_' + column]
+    elif column in BOOLEAN_COLUMNS:
+      value = str(value).lower() in ('1', 'true', 't', 'yes', 'y') if value is not None else False
+    elif column in INTEGER_COLUMNS and value is not None:
+      value = int(value)
+    record[column] = value
+  return record
+
+def resolve_show_references(rows):
+  # Fill venue_id/artist_id from venue_name/artist_name, then check that
+  # every referenced id exists.  Two IN queries per model per chunk.
+  for model, id_key, name_key in ((Venue, 'venue_id', 'venue_name'), (Artist, 'artist_id', 'artist_name')):
+    names = {row[name_key] for row in rows if id_key not in row and name_key in row}
+    if names:
+      by_name = dict(db.session.execute(select(model.name, model.id).where(model.name.in_(names))).all())
+      for row in rows:
+        if id_key not in row and row.get(name_key) in by_name:
+          row[id_key] = by_name[row[name_key]]
+    ids = set()
+    for row in rows:
+      try:
+        ids.add(int(row[id_key]))
+      except (KeyError, TypeError, ValueError):
+        pass
+    known = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars()) if ids else set()
+    for row in rows:
+      try:
+        if int(row[id_key]) not in known:
+          row.setdefault('_errors', {})[id_key] = ['No such record']
+      except (KeyError, TypeError, ValueError):
+        row.setdefault('_errors', {})[id_key] = ['Missing or unresolvable reference']
+
+def copy_rows(table, columns, records):
+  connection = db.session.connection().connection.dbapi_connection
+  buffer = io.StringIO()
+  writer = csv.writer(buffer)
+  for record in records:
+    writer.writerow([
+      '\\N' if record[column] is None else
+      record[column].isoformat() if hasattr(record[column], 'isoformat') else record[column]
+      for column in columns])
+  buffer.seek(0)
+  sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+  cursor = connection.cursor()
+  try:
+    if hasattr(cursor, 'copy_expert'):
+      cursor.copy_expert(sql, buffer)
+    else:
+      with cursor.copy(sql) as copy:
+        copy.write(buffer.getvalue())
+  finally:
+    cursor.close()
+
+def insert_chunk(table, columns, records):
+  if not records:
+    return
+  if db.session.get_bind().dialect.name == 'postgresql':
+    # A large chunk can outlast DB_STATEMENT_TIMEOUT_MS, which is meant for requests.
+    db.session.execute(text('SET LOCAL statement_timeout = 0'))
+    copy_rows(table, columns, records)
+  else:
+    db.session.execute(insert(table), records)
+
+def allocate_ids(model, rows):
+  missing = [row for row in rows if 'id' not in row]
+  if not missing:
+    return
+  explicit = [int(row['id']) for row in rows if 'id' in row]
+  table = model.__tablename__
+  if db.session.get_bind().dialect.name == 'postgresql':
+    if explicit:
+      # Move the sequence past ids given in the file so nextval can't reuse them.
+      db.session.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), greatest((SELECT coalesce(max(id), 0) FROM {table}), :floor))"),
+        {"floor": max(explicit)})
+    ids = db.session.execute(text(
+      f"SELECT nextval(pg_get_serial_sequence('{table}', 'id')) FROM generate_series(1, :count)"),
+      {"count": len(missing)}).scalars()
+  else:
+    start = max([db.session.query(func.coalesce(func.max(model.id), 0)).scalar()] + explicit) + 1
+    ids = range(start, start + len(missing))
+  for row, id in zip(missing, ids):
+    row['id'] = id
+
+def link_genres(kind, rows):
+  if kind not in GENRE_LINKS:
+    return
+  table, owner_column = GENRE_LINKS[kind]
+  genres = Genre.named({name for row in rows for name in row.get('genres', ())})
+  db.session.add_all(genres)
+  db.session.flush()
+  genre_ids = {genre.name: genre.id for genre in genres}
+  records = [{owner_column: int(row['id']), 'genre_id': genre_ids[name]}
+    for row in rows for name in dict.fromkeys(row.get('genres', ()))]
+  insert_chunk(table, [owner_column, 'genre_id'], records)
+
+def reset_sequence(model):
+  if db.session.get_bind().dialect.name == 'postgresql':
+    table = model.__tablename__
+    db.session.execute(text(
+      f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce((SELECT max(id) FROM {table}), 1))"))
+
+def import_rows(kind, rows, chunk_size, rejects=None):
+  model, form_class, all_columns = KINDS[kind]
+  inserted = rejected = 0
+  started = time.perf_counter()
+  for chunk in chunked(rows, chunk_size):
+    chunk = [normalize(kind, row) for row in chunk]
+    if kind == 'shows':
+      resolve_show_references(chunk)
+    valid = []
+    for row in chunk:
+      errors = row.pop('_errors', None) or form_errors(form_class, row)
+      if errors:
+        rejected += 1
+        if rejects is not None:
+          rejects.write(json.dumps({"row": {k: v for k, v in row.items() if not k.startswith('_')}, "errors": errors}, default=str) + '\n')
+      else:
+        valid.append(row)
+    allocate_ids(model, valid)
+    insert_chunk(model.__table__, all_columns, [to_record(kind, all_columns, row) for row in valid])
+    link_genres(kind, valid)
+    db.session.commit()
+    inserted += len(valid)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{kind}: {inserted} inserted, {rejected} rejected, {inserted / elapsed:,.0f} rows/s', err=True)
+  reset_sequence(model)
+  if kind == 'shows':
+    recount_shows()
+  else:
+    rebuild_facets([kind])
+  db.session.commit()
+  return inserted, rejected, time.perf_counter() - started
+
+def export_rows(kind, chunk_size):
+  model, _, columns = KINDS[kind]
+  table = model.__table__
+  query = select(*[table.c[column] for column in columns]).order_by(table.c.id)
+  result = db.session.execute(query.execution_options(yield_per=chunk_size))
+  for rows in result.partitions():
+    genres = chunk_genres(kind, [row.id for row in rows])
+    for row in rows:
+      record = dict(row._mapping)
+      if kind in GENRE_LINKS:
+        record['genres'] = genres.get(row.id, [])
+      for column in ('start_time', 'end_time'):
+        if column in record:
+          record[column] = as_utc(record[column]).isoformat()
+      yield record
+
+def chunk_genres(kind, ids):
+  if kind not in GENRE_LINKS or not ids:
+    return {}
+  table, owner_column = GENRE_LINKS[kind]
+  owner_id = table.c[owner_column]
+  genres = {}
+  for owner, name in db.session.execute(select(owner_id, Genre.name)
+      .join(Genre, Genre.id == table.c.genre_id)
+      .where(owner_id.in_(ids))
+      .order_by(owner_id, Genre.name)):
+    genres.setdefault(owner, []).append(name)
+  return genres
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(list(KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=5000, show_default=True)
+@click.option('--rejects', type=click.File('w'), help='Write rejected rows and their errors here as JSONL.')
+@with_appcontext
+def import_data_command(kind, path, fmt, chunk_size, rejects):
+  """Load venues, artists or shows from a CSV or JSONL file."""
+  # flask_wtf forms look for a request; give them an empty one.
+  with current_app.test_request_context():
+    inserted, rejected, elapsed = import_rows(kind, read_rows(path, file_format(path, fmt)), chunk_size, rejects)
+  click.echo(f'Imported {inserted} {kind} ({rejected} rejected) in {elapsed:.1f}s, '
+    f'{inserted / elapsed if elapsed else 0:,.0f} rows/s')
+
+@click.command('export-data')
+@click.argument('kind', type=click.Choice(list(KINDS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=5000, show_default=True)
+@with_appcontext
+def export_data_command(kind, path, fmt, chunk_size):
+  """Write every venue, artist or show to a CSV or JSONL file."""
+  fmt = file_format(path, fmt)
+  columns = KINDS[kind][2] + (['genres'] if kind in GENRE_LINKS else [])
+  started = time.perf_counter()
+  count = 0
+  with open(path, 'w', newline='', encoding='utf-8') as f:
+    writer = csv.DictWriter(f, fieldnames=columns) if fmt == 'csv' else None
+    if writer:
+      writer.writeheader()
+    for record in export_rows(kind, chunk_size):
+      if writer:
+        if kind in GENRE_LINKS:
+          record['genres'] = ';'.join(record['genres'])
+        writer.writerow(record)
+      else:
+        f.write(json.dumps(record) + '\n')
+      count += 1
+  elapsed = time.perf_counter() - started
+  click.echo(f'Exported {count} {kind} in {elapsed:.1f}s, {count / elapsed if elapsed else 0:,.0f} rows/s')
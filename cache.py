@@ -0,0 +1,190 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, g, make_response, request, session
+
+# Rendered-page cache for the venue and artist detail pages.
+#
+# Entries are whole responses keyed by path and query string, and tagged with
+# the venues and artists they show ("venue:1", "artist:4").  Write handlers
+# invalidate by tag, so a page is dropped exactly when something on it
+# changes; the TTL only bounds how long an entry can outlive a write made
+# outside the app.
+
+def venue_tag(venue_id):
+  return f'venue:{venue_id}'
+
+def artist_tag(artist_id):
+  return f'artist:{artist_id}'
+
+class MemoryBackend:
+  # In-process LRU.  Each worker keeps its own copy, so invalidation only
+  # reaches the worker that handled the write; use the redis backend when
+  # running more than one process.
+
+  def __init__(self, max_entries):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.tags = {}
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        return None
+      expires_at, value, tags = entry
+      if expires_at < time.monotonic():
+        self._drop(key)
+        return None
+      self.entries.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl, tags):
+    with self.lock:
+      if key in self.entries:
+        self._drop(key)
+      self.entries[key] = (time.monotonic() + ttl, value, tags)
+      for tag in tags:
+        self.tags.setdefault(tag, set()).add(key)
+      while len(self.entries) > self.max_entries:
+        self._drop(next(iter(self.entries)))
+
+  def invalidate(self, tags):
+    with self.lock:
+      for tag in tags:
+        for key in self.tags.pop(tag, ()):
+          self._drop(key)
+
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.tags.clear()
+
+  def _drop(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is None:
+      return
+    for tag in entry[2]:
+      keys = self.tags.get(tag)
+      if keys is not None:
+        keys.discard(key)
+        if not keys:
+          del self.tags[tag]
+
+class RedisBackend:
+  # Shared by every worker on the host.  Eviction is left to Redis: run it
+  # with maxmemory-policy allkeys-lru.  Each tag is a set of the keys that
+  # carry it.
+
+  def __init__(self, url, prefix='fyyur:page:'):
+    try:
+      import redis
+    except ImportError:
+      raise RuntimeError("RESPONSE_CACHE_BACKEND = 'redis' requires the redis package")
+    self.client = redis.Redis.from_url(url)
+    self.prefix = prefix
+
+  def get(self, key):
+    value = self.client.get(self.prefix + key)
+    return pickle.loads(value) if value is not None else None
+
+  def set(self, key, value, ttl, tags):
+    pipe = self.client.pipeline()
+    pipe.setex(self.prefix + key, ttl, pickle.dumps(value))
+    for tag in tags:
+      pipe.sadd(self.prefix + 'tag:' + tag, key)
+      pipe.expire(self.prefix + 'tag:' + tag, ttl)
+    pipe.execute()
+
+  def invalidate(self, tags):
+    for tag in tags:
+      tag_key = self.prefix + 'tag:' + tag
+      keys = self.client.smembers(tag_key)
+      pipe = self.client.pipeline()
+      if keys:
+        pipe.delete(*[self.prefix + key.decode('utf-8') for key in keys])
+      pipe.delete(tag_key)
+      pipe.execute()
+
+  def clear(self):
+    keys = list(self.client.scan_iter(self.prefix + '*'))
+    if keys:
+      self.client.delete(*keys)
+
+class ResponseCache:
+  def __init__(self, app=None):
+    self.backend = None
+    self.hits = 0
+    self.misses = 0
+    self.counter_lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+    app.config.setdefault('RESPONSE_CACHE_TTL', 300)
+    app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+    app.config.setdefault('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    self.ttl = app.config['RESPONSE_CACHE_TTL']
+    backend = app.config['RESPONSE_CACHE_BACKEND']
+    if backend == 'memory':
+      self.backend = MemoryBackend(app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+    elif backend == 'redis':
+      self.backend = RedisBackend(app.config['RESPONSE_CACHE_REDIS_URL'])
+    elif backend is None:
+      self.backend = None
+    else:
+      raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND {backend!r}')
+    app.extensions['response_cache'] = self
+
+  def add_tags(self, *tags):
+    # Lets a view tag its page with entities it only discovers while
+    # building it, e.g. the artists playing at a venue.
+    if 'cache_tags' in g:
+      g.cache_tags.update(tags)
+
+  def invalidate(self, *tags):
+    if self.backend is not None:
+      self.backend.invalidate(tags)
+
+  def stats(self):
+    with self.counter_lock:
+      return {"hits": self.hits, "misses": self.misses}
+
+  def _count(self, name):
+    with self.counter_lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def cached(self, tags):
+    def decorator(view):
+      @wraps(view)
+      def wrapper(*args, **kwargs):
+        # Pages carrying flashed messages are personal; render them fresh.
+        if self.backend is None or request.method != 'GET' or '_flashes' in session:
+          return view(*args, **kwargs)
+        # Behind @conditional the key includes the page's ETag, so an entry
+        # also goes stale when the page changes without a write (a show
+        # starting moves it from upcoming to past).
+        key = request.full_path
+        if 'etag' in g:
+          key += '#' + g.etag
+        entry = self.backend.get(key)
+        if entry is not None:
+          self._count('hits')
+          body, status, headers = entry
+          response = Response(body, status=status, headers=headers)
+          response.headers['X-Cache'] = 'HIT'
+          return response
+        self._count('misses')
+        g.cache_tags = set(tags(**kwargs))
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+          headers = [('Content-Type', response.content_type)]
+          self.backend.set(key, (response.get_data(), response.status_code, headers), self.ttl, g.cache_tags)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+      return wrapper
+    return decorator
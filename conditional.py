@@ -0,0 +1,91 @@
+import hashlib
+import json
+from functools import wraps
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import case, func
+from werkzeug.http import is_resource_modified
+from models import db, Artist, Show, Venue, as_utc, utcnow
+
+# Conditional GET (ETag / Last-Modified / 304).
+#
+# Detail pages get their ETag from one aggregate over the entity, its shows
+# and their counterparts' updated_at columns, so a revalidation costs a
+# single indexed query and no rendering.  They send no Last-Modified: a
+# deleted show leaves every remaining timestamp as it was, so only the
+# ETag, which also covers the show count, can tell the page changed.
+# Listing pages hash the page data they already fetched, before it is
+# rendered.
+
+def make_etag(*parts):
+  raw = json.dumps([current_app.config['ETAG_SALT'], parts], sort_keys=True, default=str)
+  return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def personalized():
+  # Flashed messages are per-user; never let those pages be revalidated.
+  return '_flashes' in session
+
+def set_validators(response, etag, last_modified=None):
+  if personalized():
+    return response
+  response.set_etag(etag)
+  if last_modified is not None:
+    response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  response.vary.add('Accept')
+  return response
+
+def not_modified(etag, last_modified=None):
+  if personalized() or is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+    return None
+  return set_validators(make_response('', 304), etag, last_modified)
+
+def detail_validators(model, owner_id, counterpart, counterpart_id, entity_id):
+  # The number of shows that have already started and the latest such start
+  # time are part of the ETag: a show moving from "upcoming" to "past"
+  # changes the page without any write.  Returns (etag, None); see above for
+  # why there is no Last-Modified.
+  now = utcnow()
+  started = Show.start_time <= now
+  row = (db.session.query(
+      model.updated_at,
+      func.max(Show.updated_at).label('shows_updated_at'),
+      func.max(counterpart.updated_at).label('counterparts_updated_at'),
+      func.max(case((started, Show.start_time))).label('last_started_at'),
+      func.count(Show.id).label('shows'),
+      func.count(case((started, Show.id))).label('started'))
+    .outerjoin(Show, owner_id == model.id)
+    .outerjoin(counterpart, counterpart.id == counterpart_id)
+    .filter(model.id == entity_id)
+    .group_by(model.id, model.updated_at)
+    .first())
+  if row is None:
+    return None, None
+  timestamps = [as_utc(value).isoformat() for value in (
+      row.updated_at, row.shows_updated_at, row.counterparts_updated_at, row.last_started_at)
+    if value is not None]
+  etag = make_etag(model.__tablename__, entity_id, row.shows, row.started, *timestamps)
+  return etag, None
+
+def venue_validators(venue_id):
+  return detail_validators(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+def artist_validators(artist_id):
+  return detail_validators(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
+
+def conditional(validators):
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if request.method not in ('GET', 'HEAD'):
+        return view(*args, **kwargs)
+      etag, last_modified = validators(**kwargs)
+      if etag is None:
+        return view(*args, **kwargs)
+      response = not_modified(etag, last_modified)
+      if response is not None:
+        return response
+      # Exposed so the response cache can key entries by version.
+      g.etag = etag
+      return set_validators(make_response(view(*args, **kwargs)), etag, last_modified)
+    return wrapper
+  return decorator
@@ -2,5 +2,56 @@ import os
 SECRET_KEY = os.urandom(32)
 basedir = os.path.abspath(os.path.dirname(__file__))
 DEBUG = True
-SQLALCHEMY_DATABASE_URI = 'postgresql://sylviapap@localhost:5431/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://sylviapap@localhost:5431/fyyur')
+# Per-process pool; size it to at least the worker's thread count.  The
+# engine options themselves are built from these in database.engine_options().
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000'))
+DB_POOL_WARMUP = int(os.environ.get('DB_POOL_WARMUP', '1'))
+# Comma-separated; GET requests are spread over these (see routing.py).
+SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+REPLICA_HEALTH_INTERVAL = int(os.environ.get('REPLICA_HEALTH_INTERVAL', '10'))
+REPLICA_MAX_LAG_SECONDS = int(os.environ.get('REPLICA_MAX_LAG_SECONDS', '30'))
+REPLICA_READ_YOUR_WRITES_SECONDS = int(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', '5'))
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_AUTOCOMPLETE_LIMIT = 10
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+STREAM_LISTINGS = 0
+STREAM_BATCH_SIZE = 500
+STREAM_BUFFER_SIZE = 16
+AREA_VENUES_LIMIT = 10
+# Venue and artist pages list this many of the most recent past shows.
+DETAIL_PAST_SHOWS_LIMIT = 50
+SHOW_BATCH_MAX = 500
+# 'thread', 'database' (run `flask worker`) or 'inline'; see tasks.py.
+TASKS_BACKEND = os.environ.get('TASKS_BACKEND', 'thread')
+TASKS_WORKERS = int(os.environ.get('TASKS_WORKERS', '4'))
+TASKS_MAX_ATTEMPTS = 5
+TASKS_RETRY_DELAY = 2
+TASKS_LOCK_TIMEOUT = 600
+RESPONSE_CACHE_BACKEND = 'memory'
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_MAX_ENTRIES = 1024
+RESPONSE_CACHE_REDIS_URL = 'redis://localhost:6379/0'
+ETAG_SALT = os.environ.get('ETAG_SALT', '')
+# Request metrics at /metrics and SQL warnings in the log; see instrumentation.py.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', '200'))
+N_PLUS_ONE_THRESHOLD = 5
+# Bearer token for /metrics, which answers 403 to everyone until one is set.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Link the fingerprinted files from `flask build-assets` when static/dist/
+# has a manifest; see assets.py.
+ASSETS_ENABLED = os.environ.get('ASSETS_ENABLED', '1') == '1'
+# Compiled templates, shared by the app's workers.  Unset: Jinja's private
+# per-user directory; empty: off; see templating.py.
+TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE')
+# {% cache %} fragments (show tiles) per worker; see templating.py.
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.environ.get('FRAGMENT_CACHE_MAX_ENTRIES', '10000'))
+FRAGMENT_CACHE_TTL = 3600
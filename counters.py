@@ -0,0 +1,108 @@
+import hashlib
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, update
+from models import db, Artist, Show, ShowRollover, Venue, as_utc, utcnow
+from tasks import tasks
+
+# Denormalized num_past_shows / num_upcoming_shows on venues and artists.
+#
+# The counters are kept "as of" the watermark in show_rollovers: a show counts
+# as upcoming when it starts after the watermark.  Writes don't touch the
+# counters themselves: recount_later() queues a "recount-owners" job for the
+# venues and artists they changed, which recomputes those rows from the shows
+# table once the write has committed.  A recount is idempotent, so a retried
+# or repeated job can't drift the counts, and a job already waiting for the
+# same owners absorbs a new one.  The rollover job advances the watermark,
+# moving every show that started in between from upcoming to past with one
+# grouped UPDATE per table.
+
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+def watermark(lock=False):
+  query = ShowRollover.query.filter(ShowRollover.id == 1)
+  if lock:
+    # Writers share the lock, the rollover job takes it exclusively, so a
+    # show is never classified against a watermark that is being moved.
+    query = query.with_for_update(read=(lock == 'share'))
+  rollover = query.one_or_none()
+  return as_utc(rollover.rolled_over_at) if rollover else None
+
+def owner_key(kind, ids):
+  # Short enough for jobs.key however many owners a batch touches.
+  ids = ','.join(map(str, ids))
+  return f'{kind}:{ids}' if len(ids) <= 200 else f'{kind}:sha1:{hashlib.sha1(ids.encode()).hexdigest()}'
+
+def recount_later(venue_ids=(), artist_ids=()):
+  # Call in the write's transaction; the job only runs if it commits.
+  for kind, ids in (('venue_ids', venue_ids), ('artist_ids', artist_ids)):
+    ids = sorted({int(id) for id in ids})
+    if ids:
+      tasks.enqueue('recount-owners', key=owner_key(kind, ids), **{kind: ids})
+
+@tasks.task('recount-owners')
+def recount_owners(venue_ids=(), artist_ids=()):
+  since = watermark(lock='share') or utcnow()
+  for (model, owner_id), ids in zip(OWNERS, (venue_ids, artist_ids)):
+    if not ids:
+      continue
+    upcoming = select(func.count(Show.id)).where(owner_id == model.id, Show.start_time > since).scalar_subquery()
+    past = select(func.count(Show.id)).where(owner_id == model.id, Show.start_time <= since).scalar_subquery()
+    # updated_at stays: it versions the detail pages (conditional.py), which
+    # count shows themselves, and this runs after the page may have been served.
+    db.session.execute(update(model).where(model.id.in_(ids))
+      .values(num_upcoming_shows=upcoming, num_past_shows=past, updated_at=model.updated_at))
+
+def delete_venue_shows(venue_id):
+  # The venue's own counters go away with it; its artists are recounted.
+  artist_ids = db.session.scalars(select(Show.artist_id).where(Show.venue_id == venue_id).distinct()).all()
+  db.session.execute(delete(Show).where(Show.venue_id == venue_id))
+  recount_later(artist_ids=artist_ids)
+
+@tasks.task('recount-shows')
+def recount_shows(now=None):
+  now = now or utcnow()
+  for model, owner_id in OWNERS:
+    upcoming = select(func.count(Show.id)).where(owner_id == model.id, Show.start_time > now).scalar_subquery()
+    past = select(func.count(Show.id)).where(owner_id == model.id, Show.start_time <= now).scalar_subquery()
+    db.session.execute(update(model).values(num_upcoming_shows=upcoming, num_past_shows=past))
+  rollover = ShowRollover.query.filter(ShowRollover.id == 1).with_for_update().one_or_none() or ShowRollover(id=1)
+  rollover.rolled_over_at = now
+  db.session.add(rollover)
+  db.session.commit()
+
+@tasks.task('rollover-shows')
+def rollover_shows(now=None):
+  now = now or utcnow()
+  since = watermark(lock='update')
+  if since is None:
+    return recount_shows(now)
+  if now > since:
+    for model, owner_id in OWNERS:
+      crossed = (select(owner_id.label('owner_id'), func.count(Show.id).label('shows'))
+        .where(Show.start_time > since, Show.start_time <= now)
+        .group_by(owner_id)
+        .subquery())
+      db.session.execute(update(model)
+        .where(model.id == crossed.c.owner_id)
+        .values(
+          num_upcoming_shows=model.num_upcoming_shows - crossed.c.shows,
+          num_past_shows=model.num_past_shows + crossed.c.shows))
+    ShowRollover.query.filter(ShowRollover.id == 1).update({'rolled_over_at': now})
+  db.session.commit()
+
+@click.command('rollover-shows')
+@with_appcontext
+def rollover_shows_command():
+  """Move shows that have started since the last run from upcoming to past."""
+  now = utcnow()
+  rollover_shows(now)
+  click.echo(f'Show counters rolled over to {now.isoformat()}')
+
+@click.command('recount-shows')
+@with_appcontext
+def recount_shows_command():
+  """Recompute every venue and artist show counter from the shows table."""
+  now = utcnow()
+  recount_shows(now)
+  click.echo(f'Show counters recounted as of {now.isoformat()}')
@@ -0,0 +1,46 @@
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from models import db
+from templating import compile_templates
+
+# Engine configuration and per-worker lifecycle.
+#
+# Pool settings come from the DB_* config keys (see config.py), so they can be
+# tuned per deployment through the environment.  Under a preforking server the
+# engine must not be shared across fork: after_fork() drops the connections a
+# worker inherited from the master, and warm_up() opens fresh ones and does
+# the first-request work (mapper configuration, template compilation) before
+# the worker accepts traffic.
+
+def engine_options(config):
+  uri = config['SQLALCHEMY_DATABASE_URI']
+  options = {
+    'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    'pool_recycle': config['DB_POOL_RECYCLE'],
+  }
+  # SQLite gets a singleton or static pool, which takes no sizing arguments.
+  if not uri.startswith('sqlite'):
+    options.update(
+      pool_size=config['DB_POOL_SIZE'],
+      max_overflow=config['DB_MAX_OVERFLOW'],
+      pool_timeout=config['DB_POOL_TIMEOUT'])
+  if uri.startswith('postgresql') and config['DB_STATEMENT_TIMEOUT_MS']:
+    options['connect_args'] = {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+  return options
+
+def after_fork(app):
+  with app.app_context():
+    engines = list(db.engines.values()) + app.extensions['replicas'].engines()
+    for engine in engines:
+      # close=False: the parent still owns those sockets.
+      engine.dispose(close=False)
+
+def warm_up(app):
+  with app.app_context():
+    configure_mappers()
+    compile_templates(app)
+    # Check out the connections together so the pool keeps all of them.
+    connections = [db.engine.connect() for _ in range(app.config['DB_POOL_WARMUP'])]
+    for connection in connections:
+      connection.execute(text('SELECT 1'))
+      connection.close()
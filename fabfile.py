@@ -4,11 +4,27 @@ from fabric.contrib.console import confirm
 # prepare for deployment
 
 
+def bench(size="small", database_uri="sqlite:////tmp/fyyur-bench.db", baseline=None):
+    # Fresh synthetic catalog, then every route against the saved baseline.
+    baseline = baseline or "benchmarks/baselines/sqlite-{}.json".format(size)
+    local("python -m benchmarks.datagen --database-uri {} --size {}".format(database_uri, size))
+    return local(
+        "python -m benchmarks.load --database-uri {} --compare {}".format(database_uri, baseline),
+        capture=False
+    )
+
+
+def save_baseline(size="small", database_uri="sqlite:////tmp/fyyur-bench.db", baseline=None):
+    baseline = baseline or "benchmarks/baselines/sqlite-{}.json".format(size)
+    local("python -m benchmarks.datagen --database-uri {} --size {}".format(database_uri, size))
+    local("python -m benchmarks.load --database-uri {} --save {}".format(database_uri, baseline))
+
+
 def test():
     with settings(warn_only=True):
-        result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
-        )
+        result = local("python -m compileall -q .", capture=True)
+        if not result.failed:
+            result = bench()
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
@@ -39,9 +55,8 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    # Read-only: startup cost and connection count against an in-memory database.
+    local("heroku run python -m benchmarks.bench_startup --runs 1")
 
 
 def deploy():
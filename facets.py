@@ -0,0 +1,117 @@
+from collections import Counter
+from itertools import product
+from uuid import uuid4
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from forms import GENRE_CHOICES
+from models import db, Artist, FacetCount, Genre, Venue, artist_genres, venue_genres
+from tasks import tasks
+
+# Precomputed browse counts.
+#
+# facet_counts holds, for venues and for artists, the number of entities per
+# (genre, state, city, seeking) combination, with ALL standing for "any" in
+# each position.  Every entity contributes one row per combination of its
+# own values and ALL, so any facet query is a primary-key lookup and a
+# breakdown along one dimension is a range scan of at most one row per
+# value.  Write handlers compute the difference between an entity's keys
+# before and after the change and queue it as an "apply-facet-deltas" job,
+# which upserts it once the write has committed; `flask refresh-facets`
+# rebuilds the table from scratch after bulk loads or on a schedule.
+
+ALL = '*'
+DIMENSIONS = ('genre', 'state', 'city', 'seeking')
+
+KINDS = {
+  'venues': (Venue, Venue.seeking_talent, venue_genres, venue_genres.c.venue_id),
+  'artists': (Artist, Artist.seeking_venue, artist_genres, artist_genres.c.artist_id),
+}
+
+def kind_of(entity):
+  return 'venues' if isinstance(entity, Venue) else 'artists'
+
+def seeking_value(value):
+  return 'true' if value else 'false'
+
+def facet_keys(entity):
+  kind = kind_of(entity)
+  seeking = entity.seeking_talent if kind == 'venues' else entity.seeking_venue
+  values = (
+    [genre.name for genre in entity.genres],
+    [entity.state or ''],
+    [entity.city or ''],
+    [seeking_value(seeking)])
+  return Counter((kind,) + key for key in product(*[[ALL] + value for value in values]))
+
+def upsert(rows):
+  dialect = db.session.get_bind().dialect.name
+  statement = (postgresql if dialect == 'postgresql' else sqlite).insert(FacetCount).values(rows)
+  return statement.on_conflict_do_update(
+    index_elements=['kind'] + list(DIMENSIONS),
+    set_={"count": FacetCount.count + statement.excluded.count})
+
+def update_facets(before=(), after=()):
+  # Call in the same transaction as the write, with facet_keys() taken
+  # before and after it.  Deltas add up, so every write gets its own job
+  # rather than being merged into one already waiting.
+  deltas = Counter(after)
+  deltas.subtract(before)
+  rows = [dict(zip(('kind',) + DIMENSIONS, key), count=delta) for key, delta in deltas.items() if delta]
+  if rows:
+    tasks.enqueue('apply-facet-deltas', key=uuid4().hex, rows=rows)
+
+@tasks.task('apply-facet-deltas')
+def apply_facet_deltas(rows):
+  db.session.execute(upsert(rows))
+
+def facet_count(kind, genre=ALL, state=ALL, city=ALL, seeking=ALL):
+  count = db.session.get(FacetCount, (kind, genre, state, city, seeking))
+  return count.count if count else 0
+
+def facet_breakdown(kind, dimension, genre=ALL, state=ALL, city=ALL, seeking=ALL):
+  fixed = {"genre": genre, "state": state, "city": city, "seeking": seeking}
+  query = FacetCount.query.filter(FacetCount.kind == kind, getattr(FacetCount, dimension) != ALL, FacetCount.count > 0)
+  for name, value in fixed.items():
+    if name != dimension:
+      query = query.filter(getattr(FacetCount, name) == value)
+  return {getattr(row, dimension): row.count for row in query}
+
+def genre_breakdown(kind, selected=(), **fixed):
+  # Same shape as genres.genre_facets(), read from the summary.
+  counts = facet_breakdown(kind, 'genre', **fixed)
+  return [{"genre": name, "count": counts.get(name, 0), "selected": name in selected} for name, _ in GENRE_CHOICES]
+
+def summary_select(kind, grouped):
+  model, seeking, link, owner_id = KINDS[kind]
+  expressions = {
+    "genre": Genre.name,
+    "state": func.coalesce(model.state, ''),
+    "city": func.coalesce(model.city, ''),
+    "seeking": case((seeking.is_(True), 'true'), else_='false'),
+  }
+  columns = [expressions[name] if name in grouped else literal(ALL) for name in DIMENSIONS]
+  query = select(literal(kind), *columns, func.count()).select_from(model)
+  if 'genre' in grouped:
+    query = query.join(link, owner_id == model.id).join(Genre, Genre.id == link.c.genre_id)
+  return query.group_by(*[expressions[name] for name in DIMENSIONS if name in grouped])
+
+@tasks.task('rebuild-facets')
+def rebuild_facets(kinds=tuple(KINDS)):
+  # One grouped INSERT ... SELECT per rollup combination.
+  for kind in kinds:
+    db.session.execute(delete(FacetCount).where(FacetCount.kind == kind))
+    for grouped in product(*[(name, None) for name in DIMENSIONS]):
+      grouped = {name for name in grouped if name}
+      db.session.execute(insert(FacetCount).from_select(
+        ['kind'] + list(DIMENSIONS) + ['count'], summary_select(kind, grouped)))
+  db.session.commit()
+
+@click.command('refresh-facets')
+@click.argument('kinds', nargs=-1, type=click.Choice(list(KINDS)))
+@with_appcontext
+def refresh_facets_command(kinds):
+  """Rebuild the browse counts in facet_counts from venues and artists."""
+  rebuild_facets(kinds or tuple(KINDS))
+  click.echo(f"Facet counts rebuilt for {', '.join(kinds or KINDS)}")
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+# Datetime formatting for the `datetime` template filter.
+#
+# Show tiles repeat the same handful of timestamps on every render, so the
+# work is split into cached steps: ISO strings are parsed with
+# datetime.fromisoformat (dateutil only for anything else), the Babel pattern
+# for each named format is compiled once per locale, and formatted strings
+# are memoized in a bounded LRU.
+
+FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma",
+}
+
+FORMAT_CACHE_SIZE = 8192
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def parse_datetime(value):
+  try:
+    # fromisoformat only learned the 'Z' suffix in Python 3.11.
+    return datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+  except ValueError:
+    return dateutil.parser.parse(value)
+
+@lru_cache(maxsize=None)
+def compiled_format(format, locale):
+  return babel.dates.parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_parsed(wall_time, offset, format, locale):
+  # Keyed on the wall-clock time and its offset, not the datetime: aware
+  # values for the same instant compare (and hash) equal whatever their
+  # offset, so they would share one cached string.
+  pattern, locale = compiled_format(format, locale)
+  # Same as babel.dates.format_datetime: naive values are UTC.
+  date = wall_time.replace(tzinfo=timezone.utc if offset is None else timezone(offset))
+  return pattern.apply(date, locale)
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+  date = value if isinstance(value, datetime) else parse_datetime(value)
+  return format_parsed(date.replace(tzinfo=None), date.utcoffset(), format, locale)
@@ -0,0 +1,51 @@
+from flask import request
+from sqlalchemy import func, select
+from forms import GENRE_CHOICES
+from models import db, Artist, Genre, Venue, artist_genres, venue_genres
+
+# Genre filtering and facet counts for the listing and search pages.
+#
+# A filter on several genres matches entities with any of them, through the
+# (genre_id, owner) index on the link table.  Facet counts for search results
+# are computed here over the search condition but not the genre filter, so
+# every choice shows how many results picking it would add; listing pages
+# read theirs from the summary table in facets.py.  The choices come from
+# forms.py.
+
+LINKS = {
+  Venue: (venue_genres, venue_genres.c.venue_id),
+  Artist: (artist_genres, artist_genres.c.artist_id),
+}
+
+def requested_genres():
+  names = request.values.getlist('genre')
+  choices = {name for name, _ in GENRE_CHOICES}
+  return [name for name in names if name in choices]
+
+def with_genre(model, names):
+  table, owner_id = LINKS[model]
+  return (select(owner_id)
+    .join(Genre, Genre.id == table.c.genre_id)
+    .where(Genre.name.in_(names)))
+
+def with_genre_matching(model, pattern):
+  # Entities with a genre whose name matches an ILIKE pattern.
+  table, owner_id = LINKS[model]
+  return (select(owner_id)
+    .join(Genre, Genre.id == table.c.genre_id)
+    .where(Genre.name.ilike(pattern, escape='\\')))
+
+def filter_by_genres(query, model, names):
+  if not names:
+    return query
+  return query.filter(model.id.in_(with_genre(model, names)))
+
+def genre_facets(model, condition=None, selected=()):
+  table, owner_id = LINKS[model]
+  counts = (db.session.query(Genre.name, func.count(owner_id))
+    .join(table, table.c.genre_id == Genre.id)
+    .group_by(Genre.name))
+  if condition is not None:
+    counts = counts.join(model, model.id == owner_id).filter(condition)
+  counts = dict(counts.all())
+  return [{"genre": name, "count": counts.get(name, 0), "selected": name in selected} for name, _ in GENRE_CHOICES]
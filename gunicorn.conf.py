@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+
+# gunicorn -c gunicorn.conf.py wsgi:app
+#
+# The app is imported once in the master and shared copy-on-write with the
+# workers; each worker then drops the inherited pool and warms its own before
+# taking requests.  With WEB_THREADS > 1 keep DB_POOL_SIZE >= WEB_THREADS.
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', '1'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('WEB_TIMEOUT', '30'))
+preload_app = os.environ.get('WEB_PRELOAD', '1') == '1'
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+def post_fork(server, worker):
+  if preload_app:
+    from database import after_fork
+    from wsgi import app
+    after_fork(app)
+
+def post_worker_init(worker):
+  from database import warm_up
+  warm_up(worker.wsgi)
+  worker.log.info('Worker %s warmed up', worker.pid)
@@ -0,0 +1,222 @@
+import hmac
+import threading
+import time
+from collections import Counter
+from flask import Response, abort, current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL and timing metrics.
+#
+# Every statement run inside a request, on any engine (primary or replica),
+# is counted and timed through engine events.  When the request finishes,
+# its route gets one observation each of total latency, time spent in the
+# database, time spent rendering templates and number of statements, and
+# /metrics serves them as Prometheus histograms.
+#
+# Two things are logged, through the app logger's "sql" child:
+#   - any statement slower than SLOW_QUERY_MS, with the route it ran for;
+#   - N+1 patterns: the same parameterized statement executed
+#     N_PLUS_ONE_THRESHOLD or more times in one request (an executemany
+#     counts once), which is what a lazy load inside a loop looks like.
+#
+# Streamed responses (?stream=1 listings) are recorded when the server closes
+# them, so their numbers cover the whole body.
+#
+# /metrics needs `Authorization: Bearer <METRICS_TOKEN>` and answers 403
+# while no token is configured.  The client address is no guide: behind
+# the reverse proxy gunicorn.conf.py expects, every request comes from
+# loopback.
+#
+# The numbers are per process; with several gunicorn workers, scrape each
+# one or run a worker per container.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+class Histogram:
+  def __init__(self, name, help, labels, buckets):
+    self.name = name
+    self.help = help
+    self.labels = labels
+    self.buckets = buckets
+    self.series = {}
+
+  def observe(self, labels, value):
+    series = self.series.get(labels)
+    if series is None:
+      series = self.series[labels] = [0] * len(self.buckets) + [0, 0]
+    for index, bound in enumerate(self.buckets):
+      if value <= bound:
+        series[index] += 1
+    series[-2] += value
+    series[-1] += 1
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+    for labels, series in sorted(self.series.items()):
+      base = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, labels))
+      prefix = base + ',' if base else ''
+      for bound, count in zip(self.buckets, series):
+        lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+      lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series[-1]}')
+      lines.append(f'{self.name}_sum{{{base}}} {series[-2]}')
+      lines.append(f'{self.name}_count{{{base}}} {series[-1]}')
+    return lines
+
+class Counters:
+  def __init__(self, name, help, labels):
+    self.name = name
+    self.help = help
+    self.labels = labels
+    self.series = Counter()
+
+  def inc(self, labels, value=1):
+    self.series[labels] += value
+
+  def render(self):
+    lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+    for labels, value in sorted(self.series.items()):
+      base = ','.join(f'{name}="{escape(value)}"' for name, value in zip(self.labels, labels))
+      lines.append(f'{self.name}{{{base}}} {value}')
+    return lines
+
+def escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class RequestMetrics:
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.statements = Counter()
+    self.db_time = 0.0
+    self.render_time = 0.0
+    self.render_started = []
+
+class Instrumentation:
+  def __init__(self, app=None):
+    self.lock = threading.Lock()
+    self.requests = Histogram('fyyur_request_duration_seconds', 'Request latency.', ('route', 'method', 'status'), DEFAULT_BUCKETS)
+    self.db_time = Histogram('fyyur_request_db_seconds', 'Time spent in SQL per request.', ('route',), DEFAULT_BUCKETS)
+    self.render_time = Histogram('fyyur_request_render_seconds', 'Time spent rendering templates per request.', ('route',), DEFAULT_BUCKETS)
+    self.statements = Histogram('fyyur_request_statements', 'SQL statements per request.', ('route',), STATEMENT_BUCKETS)
+    self.slow_queries = Counters('fyyur_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('route',))
+    self.n_plus_one = Counters('fyyur_n_plus_one_total', 'Requests with a statement repeated N_PLUS_ONE_THRESHOLD times or more.', ('route',))
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.extensions['instrumentation'] = self
+    if not app.config['METRICS_ENABLED']:
+      return
+    app.before_request(start_request)
+    app.after_request(self.finish_request)
+    before_render_template.connect(start_render, app)
+    template_rendered.connect(finish_render, app)
+    app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+  def finish_request(self, response):
+    metrics = g.get('request_metrics')
+    if metrics is None:
+      return response
+    # Captured now: a streamed body's close callback may run after the
+    # request context is gone.
+    observation = (current_app._get_current_object(), route_name(), request.method, str(response.status_code))
+    if response.is_streamed:
+      # The body runs after this hook, with g still in place, so its queries
+      # land in the same metrics until the server closes the response.
+      response.call_on_close(lambda: self.record(metrics, *observation))
+    else:
+      g.pop('request_metrics')
+      self.record(metrics, *observation)
+    return response
+
+  def record(self, metrics, app, route, method, status):
+    elapsed = time.perf_counter() - metrics.started
+    statements = sum(metrics.statements.values())
+    repeated = [(sql, count) for sql, count in metrics.statements.items()
+      if count >= app.config['N_PLUS_ONE_THRESHOLD']]
+    with self.lock:
+      self.requests.observe((route, method, status), elapsed)
+      self.db_time.observe((route,), metrics.db_time)
+      self.render_time.observe((route,), metrics.render_time)
+      self.statements.observe((route,), statements)
+      if repeated:
+        self.n_plus_one.inc((route,))
+    for sql, count in repeated:
+      app.logger.getChild('sql').warning('N+1 on %s %s: %d executions of %s', method, route, count, ' '.join(sql.split())[:500])
+
+  def record_slow_query(self, route):
+    with self.lock:
+      self.slow_queries.inc((route,))
+
+  def metrics_view(self):
+    token = current_app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not token or not hmac.compare_digest(supplied.encode(), token.encode()):
+      abort(403)
+    lines = []
+    with self.lock:
+      for metric in (self.requests, self.db_time, self.render_time, self.statements, self.slow_queries, self.n_plus_one):
+        lines.extend(metric.render())
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+      stats = cache.stats()
+      lines += ['# HELP fyyur_response_cache_requests_total Response cache lookups.',
+        '# TYPE fyyur_response_cache_requests_total counter',
+        f'fyyur_response_cache_requests_total{{result="hit"}} {stats["hits"]}',
+        f'fyyur_response_cache_requests_total{{result="miss"}} {stats["misses"]}']
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def route_name():
+  # The URL rule, not the path, so /venues/1 and /venues/2 share a series.
+  return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def sql_logger():
+  return current_app.logger.getChild('sql')
+
+def current_metrics():
+  if has_request_context():
+    return g.get('request_metrics')
+  return None
+
+def start_request():
+  g.request_metrics = RequestMetrics()
+
+def start_render(sender, template, context, **extra):
+  metrics = current_metrics()
+  if metrics is not None:
+    metrics.render_started.append(time.perf_counter())
+
+def finish_render(sender, template, context, **extra):
+  metrics = current_metrics()
+  if metrics is not None and metrics.render_started:
+    metrics.render_time += time.perf_counter() - metrics.render_started.pop()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  if current_metrics() is not None:
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+  metrics = current_metrics()
+  if metrics is None or not conn.info.get('query_started'):
+    return
+  elapsed = time.perf_counter() - conn.info['query_started'].pop()
+  metrics.statements[statement] += 1
+  metrics.db_time += elapsed
+  if elapsed * 1000 >= current_app.config['SLOW_QUERY_MS']:
+    route = route_name()
+    current_app.extensions['instrumentation'].record_slow_query(route)
+    sql_logger().warning('Slow query (%.0f ms) on %s %s: %s', elapsed * 1000, request.method, route, ' '.join(statement.split())[:500])
+
+@event.listens_for(Engine, 'handle_error')
+def handle_error(context):
+  # A failed statement never reaches after_cursor_execute.
+  connection = context.connection
+  if connection is not None and connection.info.get('query_started'):
+    connection.info['query_started'].pop()
@@ -0,0 +1,28 @@
+"""keyset pagination indexes
+
+Revision ID: 5e09b3a1d7c4
+Revises: c2b7e4d91f05
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e09b3a1d7c4'
+down_revision = 'c2b7e4d91f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venues_name_id', 'venues', ['name', 'id'])
+    op.create_index('ix_artists_name_id', 'artists', ['name', 'id'])
+    op.create_index('ix_shows_start_time_id', 'shows', ['start_time', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_start_time_id', table_name='shows')
+    op.drop_index('ix_artists_name_id', table_name='artists')
+    op.drop_index('ix_venues_name_id', table_name='venues')
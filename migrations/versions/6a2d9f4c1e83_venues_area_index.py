@@ -0,0 +1,30 @@
+"""venues area index over coalesced state/city
+
+Revision ID: 6a2d9f4c1e83
+Revises: 1c7e5b9a3f20
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2d9f4c1e83'
+down_revision = '1c7e5b9a3f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The area listing groups a missing state or city as '', so the index
+    # is over the same expressions for the areas page and the drill-down to
+    # keep reading it in order.
+    op.create_index('ix_venues_area', 'venues',
+        [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"), 'name', 'id'])
+    op.drop_index('ix_venues_state_city', table_name='venues')
+
+
+def downgrade():
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city', 'name', 'id'])
+    op.drop_index('ix_venues_area', table_name='venues')
@@ -0,0 +1,36 @@
+"""updated_at columns for conditional GET
+
+Revision ID: 71c8d5e2a4f6
+Revises: e61f0a3c5b92
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '71c8d5e2a4f6'
+down_revision = 'e61f0a3c5b92'
+branch_labels = None
+depends_on = None
+
+TABLES = ('venues', 'artists', 'shows')
+
+
+def upgrade():
+    # SQLite can't ADD COLUMN with a non-constant default to a table with
+    # rows, so: nullable, backfilled, then NOT NULL through a batch op.
+    for table in TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+        op.execute(sa.table(table, sa.column('updated_at', sa.DateTime(timezone=True)))
+            .update().values(updated_at=sa.func.current_timestamp()))
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(timezone=True),
+                nullable=False, server_default=sa.func.now())
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
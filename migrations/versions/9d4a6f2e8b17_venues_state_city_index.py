@@ -0,0 +1,26 @@
+"""venues state/city index
+
+Revision ID: 9d4a6f2e8b17
+Revises: 5e09b3a1d7c4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4a6f2e8b17'
+down_revision = '5e09b3a1d7c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # name and id trail (state, city) so the per-area venue lists and the
+    # area drill-down read venues in display order straight off the index.
+    op.create_index('ix_venues_state_city', 'venues', ['state', 'city', 'name', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_venues_state_city', table_name='venues')
@@ -0,0 +1,50 @@
+"""search indexes
+
+Revision ID: a83e51f0c6d2
+Revises: 4f1d2c9a7b30
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a83e51f0c6d2'
+down_revision = '4f1d2c9a7b30'
+branch_labels = None
+depends_on = None
+
+# The document expression must match search.search_document() exactly,
+# otherwise the planner will not use the GIN index.
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || "
+    "coalesce(city, '') || ' ' || coalesce(genres, ''))"
+)
+
+TABLES = ('venues', 'artists')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in TABLES:
+        op.execute(
+            'CREATE INDEX ix_{0}_search_document ON {0} USING gin ({1})'.format(table, SEARCH_DOCUMENT))
+        op.execute(
+            'CREATE INDEX ix_{0}_name_trgm ON {0} USING gin (name gin_trgm_ops)'.format(table))
+        op.execute(
+            'CREATE INDEX ix_{0}_city_trgm ON {0} USING gin (city gin_trgm_ops)'.format(table))
+        op.execute(
+            'CREATE INDEX ix_{0}_name_prefix ON {0} (lower(name) text_pattern_ops)'.format(table))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.drop_index('ix_{0}_name_prefix'.format(table), table_name=table)
+        op.drop_index('ix_{0}_city_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{0}_name_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{0}_search_document'.format(table), table_name=table)
@@ -0,0 +1,128 @@
+"""genres as link tables
+
+Revision ID: b3f6a8d1c947
+Revises: 71c8d5e2a4f6
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+import csv
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6a8d1c947'
+down_revision = '71c8d5e2a4f6'
+branch_labels = None
+depends_on = None
+
+# forms.GENRE_CHOICES at the time of this revision.
+GENRE_NAMES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+    'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+    'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other',
+]
+
+# (owner table, link table, owner column)
+OWNERS = (('venues', 'venue_genres', 'venue_id'), ('artists', 'artist_genres', 'artist_id'))
+
+# search.search_document() before and after genres left the row.
+OLD_SEARCH_DOCUMENT = (
+    "to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || "
+    "coalesce(city, '') || ' ' || coalesce(genres, ''))"
+)
+SEARCH_DOCUMENT = "to_tsvector('simple'::regconfig, coalesce(name, '') || ' ' || coalesce(city, ''))"
+
+genres = sa.table('genres', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+
+def owner_table(name):
+    return sa.table(name, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+
+
+def link_table(name, owner_column):
+    return sa.table(name, sa.column(owner_column, sa.Integer), sa.column('genre_id', sa.Integer))
+
+
+def parse_genres(value):
+    # The old column held whatever the driver made of a Python list:
+    # '{Jazz,"Rock n Roll"}' on PostgreSQL, or a plain comma-separated string.
+    value = (value or '').strip()
+    if value.startswith('{') and value.endswith('}'):
+        value = value[1:-1]
+    if not value:
+        return []
+    return [name.strip() for name in next(csv.reader([value], skipinitialspace=True)) if name.strip()]
+
+
+def format_genres(names):
+    return '{' + ','.join('"{}"'.format(name) if ' ' in name or ',' in name else name for name in names) + '}'
+
+
+def recreate_search_index(document):
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, _, _ in OWNERS:
+        op.execute('DROP INDEX IF EXISTS ix_{0}_search_document'.format(table))
+        op.execute('CREATE INDEX ix_{0}_search_document ON {0} USING gin ({1})'.format(table, document))
+
+
+def upgrade():
+    op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, link, owner_column in OWNERS:
+        op.create_table(link,
+        sa.Column(owner_column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([owner_column], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ),
+        sa.PrimaryKeyConstraint(owner_column, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id_{}'.format(link, owner_column), link, ['genre_id', owner_column])
+
+    connection = op.get_bind()
+    names = list(GENRE_NAMES)
+    existing = {}
+    for table, _, _ in OWNERS:
+        owner = owner_table(table)
+        existing[table] = [
+            (row.id, parse_genres(row.genres)) for row in connection.execute(sa.select(owner.c.id, owner.c.genres))]
+        names += [name for _, row_names in existing[table] for name in row_names]
+    op.bulk_insert(genres, [{'name': name} for name in dict.fromkeys(names)])
+    genre_ids = dict(connection.execute(sa.select(genres.c.name, genres.c.id)).all())
+    for table, link, owner_column in OWNERS:
+        rows = [{owner_column: owner_id, 'genre_id': genre_ids[name]}
+                for owner_id, row_names in existing[table] for name in dict.fromkeys(row_names)]
+        if rows:
+            op.bulk_insert(link_table(link, owner_column), rows)
+
+    recreate_search_index(SEARCH_DOCUMENT)
+    for table, _, _ in OWNERS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table, link, owner_column in OWNERS:
+        op.add_column(table, sa.Column('genres', sa.String(), nullable=True))
+        links = link_table(link, owner_column)
+        rows = connection.execute(sa.select(links.c[owner_column], genres.c.name)
+            .join(genres, genres.c.id == links.c.genre_id)
+            .order_by(links.c[owner_column], genres.c.name)).all()
+        by_owner = {}
+        for owner_id, name in rows:
+            by_owner.setdefault(owner_id, []).append(name)
+        owner = owner_table(table)
+        for owner_id, names in by_owner.items():
+            op.execute(owner.update().where(owner.c.id == owner_id).values(genres=format_genres(names)))
+    recreate_search_index(OLD_SEARCH_DOCUMENT)
+    for _, link, owner_column in OWNERS:
+        op.drop_index('ix_{}_genre_id_{}'.format(link, owner_column), table_name=link)
+        op.drop_table(link)
+    op.drop_table('genres')
@@ -0,0 +1,40 @@
+"""show start_time as timestamptz with composite indexes
+
+Revision ID: c2b7e4d91f05
+Revises: a83e51f0c6d2
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2b7e4d91f05'
+down_revision = 'a83e51f0c6d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column(
+            'start_time',
+            existing_type=sa.String(),
+            type_=sa.DateTime(timezone=True),
+            nullable=False,
+            postgresql_using='start_time::timestamptz')
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'])
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'])
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_start_time', table_name='shows')
+    op.drop_index('ix_shows_venue_id_start_time', table_name='shows')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column(
+            'start_time',
+            existing_type=sa.DateTime(timezone=True),
+            type_=sa.String(),
+            nullable=True,
+            postgresql_using="to_char(start_time AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.MS\"Z\"')")
@@ -0,0 +1,69 @@
+"""facet_counts summary table
+
+Revision ID: d8e2c4a6b105
+Revises: b3f6a8d1c947
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from itertools import product
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2c4a6b105'
+down_revision = 'b3f6a8d1c947'
+branch_labels = None
+depends_on = None
+
+ALL = '*'
+DIMENSIONS = ('genre', 'state', 'city', 'seeking')
+
+# (kind, owner table, seeking column, link table, owner column)
+KINDS = (
+    ('venues', 'venues', 'seeking_talent', 'venue_genres', 'venue_id'),
+    ('artists', 'artists', 'seeking_venue', 'artist_genres', 'artist_id'),
+)
+
+genres = sa.table('genres', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+
+def summary_select(kind, owner_name, seeking_name, link_name, owner_column, grouped):
+    # Same rows as facets.summary_select() at the time of this revision.
+    owner = sa.table(owner_name, sa.column('id', sa.Integer), sa.column('state', sa.String),
+                     sa.column('city', sa.String), sa.column(seeking_name, sa.Boolean))
+    link = sa.table(link_name, sa.column(owner_column, sa.Integer), sa.column('genre_id', sa.Integer))
+    expressions = {
+        'genre': genres.c.name,
+        'state': sa.func.coalesce(owner.c.state, ''),
+        'city': sa.func.coalesce(owner.c.city, ''),
+        'seeking': sa.case((owner.c[seeking_name].is_(True), 'true'), else_='false'),
+    }
+    columns = [expressions[name] if name in grouped else sa.literal(ALL) for name in DIMENSIONS]
+    query = sa.select(sa.literal(kind), *columns, sa.func.count()).select_from(owner)
+    if 'genre' in grouped:
+        query = (query.join(link, link.c[owner_column] == owner.c.id)
+                 .join(genres, genres.c.id == link.c.genre_id))
+    return query.group_by(*[expressions[name] for name in DIMENSIONS if name in grouped])
+
+
+def upgrade():
+    facet_counts = op.create_table('facet_counts',
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('seeking', sa.String(length=5), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'genre', 'state', 'city', 'seeking')
+    )
+    for kind in KINDS:
+        for grouped in product(*[(name, None) for name in DIMENSIONS]):
+            grouped = {name for name in grouped if name}
+            op.execute(facet_counts.insert().from_select(
+                ['kind'] + list(DIMENSIONS) + ['count'], summary_select(*kind, grouped)))
+
+
+def downgrade():
+    op.drop_table('facet_counts')
@@ -0,0 +1,65 @@
+"""show counters and rollover watermark
+
+Revision ID: e61f0a3c5b92
+Revises: 9d4a6f2e8b17
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61f0a3c5b92'
+down_revision = '9d4a6f2e8b17'
+branch_labels = None
+depends_on = None
+
+shows = sa.table(
+    'shows',
+    sa.column('id', sa.Integer),
+    sa.column('venue_id', sa.Integer),
+    sa.column('artist_id', sa.Integer),
+    sa.column('start_time', sa.DateTime(timezone=True)))
+
+
+def owner_table(name):
+    return sa.table(
+        name,
+        sa.column('id', sa.Integer),
+        sa.column('num_past_shows', sa.Integer),
+        sa.column('num_upcoming_shows', sa.Integer))
+
+
+def upgrade():
+    rollovers = op.create_table('show_rollovers',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_over_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Recount from the shows table; the seed values were never maintained.
+    now = datetime.now(timezone.utc)
+    for name, owner_column in (('venues', shows.c.venue_id), ('artists', shows.c.artist_id)):
+        owner = owner_table(name)
+        upcoming = sa.select(sa.func.count(shows.c.id)).where(
+            owner_column == owner.c.id, shows.c.start_time > now).scalar_subquery()
+        past = sa.select(sa.func.count(shows.c.id)).where(
+            owner_column == owner.c.id, shows.c.start_time <= now).scalar_subquery()
+        op.execute(owner.update().values(num_upcoming_shows=upcoming, num_past_shows=past))
+        with op.batch_alter_table(name) as batch_op:
+            for column in ('num_past_shows', 'num_upcoming_shows'):
+                batch_op.alter_column(
+                    column, existing_type=sa.Integer(), nullable=False, server_default='0')
+    op.bulk_insert(rollovers, [{'id': 1, 'rolled_over_at': now}])
+
+
+def downgrade():
+    for name in ('venues', 'artists'):
+        with op.batch_alter_table(name) as batch_op:
+            for column in ('num_past_shows', 'num_upcoming_shows'):
+                batch_op.alter_column(
+                    column, existing_type=sa.Integer(), nullable=True, server_default=None)
+    op.drop_table('show_rollovers')
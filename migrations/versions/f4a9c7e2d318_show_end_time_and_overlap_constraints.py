@@ -0,0 +1,53 @@
+"""show end_time and per-venue/per-artist overlap constraints
+
+Existing shows get the default two-hour slot.  On PostgreSQL the exclusion
+constraints need btree_gist, and the upgrade fails if existing shows
+already overlap; resolve those first.
+
+Revision ID: f4a9c7e2d318
+Revises: d8e2c4a6b105
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a9c7e2d318'
+down_revision = 'd8e2c4a6b105'
+branch_labels = None
+depends_on = None
+
+shows = sa.table('shows',
+    sa.column('start_time', sa.DateTime(timezone=True)),
+    sa.column('end_time', sa.DateTime(timezone=True)))
+
+
+def upgrade():
+    postgres = op.get_bind().dialect.name == 'postgresql'
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+    if postgres:
+        default_end = shows.c.start_time + sa.text("interval '2 hours'")
+    else:
+        # Same text format SQLAlchemy writes for DateTime on SQLite.
+        default_end = sa.func.strftime('%Y-%m-%d %H:%M:%f', shows.c.start_time, '+2 hours').concat('000')
+    op.execute(shows.update().values(end_time=default_end))
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(timezone=True), nullable=False)
+        batch_op.create_check_constraint('ck_shows_end_after_start', 'end_time > start_time')
+    if postgres:
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for name, owner in (('ex_shows_venue_overlap', 'venue_id'), ('ex_shows_artist_overlap', 'artist_id')):
+            op.create_exclude_constraint(name, 'shows',
+                (owner, '='), (sa.func.tstzrange(sa.column('start_time'), sa.column('end_time')), '&&'),
+                using='gist')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('ex_shows_artist_overlap', 'shows')
+        op.drop_constraint('ex_shows_venue_overlap', 'shows')
+    with op.batch_alter_table('shows') as batch_op:
+        batch_op.drop_constraint('ck_shows_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
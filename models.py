@@ -1,20 +1,62 @@
-from flask import Flask
+from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
 from flask_migrate import Migrate
+from routing import RoutingSession
 
-app = Flask(__name__)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+# Bound to the application in app.create_app().
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
+
+def utcnow():
+	return datetime.now(timezone.utc)
+
+def as_utc(value):
+	# Naive timestamps (e.g. from the show form) are taken to be UTC; aware
+	# ones are converted, since SQLite's DateTime stores no offset.
+	if value.tzinfo is None:
+		return value.replace(tzinfo=timezone.utc)
+	return value.astimezone(timezone.utc)
 
 #Models 
 
+class Genre(db.Model):
+	__tablename__ = 'genres'
+
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(120), nullable=False, unique=True)
+
+	@classmethod
+	def named(cls, names):
+		# Rows for the given names in one query, adding any that don't exist.
+		# New rows go into the session straight away, so the next call's
+		# query autoflushes and finds them instead of adding duplicates.
+		names = [name for name in dict.fromkeys(names) if name]
+		existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))} if names else {}
+		genres = [existing.get(name) or cls(name=name) for name in names]
+		db.session.add_all([genre for genre in genres if genre.name not in existing])
+		return genres
+
+	def __repr__(self):
+		return f'<Genre {self.name}>'
+
+# Indexed by (genre_id, owner) so "venues with genre X" is a range scan.
+venue_genres = db.Table('venue_genres',
+	db.Column('venue_id', db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), primary_key=True),
+	db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+	db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table('artist_genres',
+	db.Column('artist_id', db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), primary_key=True),
+	db.Column('genre_id', db.Integer, db.ForeignKey('genres.id'), primary_key=True),
+	db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'))
+
 class Venue(db.Model):
 	__tablename__ = 'venues'
 
 	id = db.Column(db.Integer, primary_key=True)
 	name = db.Column(db.String)
-	genres = db.Column(db.String())
 	city = db.Column(db.String(120))
 	state = db.Column(db.String(120))
 	address = db.Column(db.String(120))
@@ -24,9 +66,17 @@ class Venue(db.Model):
 	seeking_talent = db.Column(db.Boolean, default=False)
 	seeking_description = db.Column(db.Text())
 	image_link = db.Column(db.String(500))
-	num_past_shows = db.Column(db.Integer())
-	num_upcoming_shows = db.Column(db.Integer())
+	num_past_shows = db.Column(db.Integer(), nullable=False, default=0, server_default='0')
+	num_upcoming_shows = db.Column(db.Integer(), nullable=False, default=0, server_default='0')
+	updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, server_default=db.func.now())
 	shows = db.relationship('Show', backref = 'venues', lazy=True)
+	genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
+
+	__table_args__ = (
+		db.Index('ix_venues_name_id', 'name', 'id'),
+		# Areas group a missing state or city as '' (see areas.py).
+		db.Index('ix_venues_area', db.text("coalesce(state, '')"), db.text("coalesce(city, '')"), 'name', 'id'),
+	)
 
 	def __repr__(self):
 		return f'<Venue {self.id}>'
@@ -36,7 +86,6 @@ class Artist(db.Model):
 
 	id = db.Column(db.Integer, primary_key=True)
 	name = db.Column(db.String)
-	genres = db.Column(db.String())
 	city = db.Column(db.String(120))
 	state = db.Column(db.String(120))
 	address = db.Column(db.String(120))
@@ -46,70 +95,125 @@ class Artist(db.Model):
 	seeking_venue = db.Column(db.Boolean, default=False)
 	seeking_description = db.Column(db.Text())
 	image_link = db.Column(db.String(500))
-	num_past_shows = db.Column(db.Integer())
-	num_upcoming_shows = db.Column(db.Integer())
+	num_past_shows = db.Column(db.Integer(), nullable=False, default=0, server_default='0')
+	num_upcoming_shows = db.Column(db.Integer(), nullable=False, default=0, server_default='0')
+	updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, server_default=db.func.now())
 	shows = db.relationship('Show', backref = 'artists', lazy=True)
+	genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
+
+	__table_args__ = (
+		db.Index('ix_artists_name_id', 'name', 'id'),
+	)
 
 	def __repr__(self):
 		return f'<Artist {self.id}>'
 
+def touch(target, *args):
+	# Changing only the genre links issues no UPDATE on the owner row, but the
+	# detail page's ETag (conditional.py) is built from updated_at.
+	target.updated_at = utcnow()
+
+for model in (Venue, Artist):
+	event.listen(model.genres, 'append', touch)
+	event.listen(model.genres, 'remove', touch)
+
+# Shows without an explicit end run this long.  No show may run longer than
+# MAX_SHOW_DURATION, which bounds the index range scan in bookings.py.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+def default_end_time(context):
+	return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
 class Show(db.Model):
 	__tablename__ = 'shows'
 
 	id = db.Column(db.Integer, primary_key=True)
 	venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'), nullable=False)
 	artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
-	start_time = db.Column(db.String())
+	start_time = db.Column(db.DateTime(timezone=True), nullable=False)
+	end_time = db.Column(db.DateTime(timezone=True), nullable=False, default=default_end_time)
+	updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow, onupdate=utcnow, server_default=db.func.now())
+
+	# On PostgreSQL a venue or an artist can't have two shows whose
+	# [start_time, end_time) ranges overlap; other databases rely on the
+	# check in bookings.py.
+	__table_args__ = (
+		db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+		db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+		db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+		db.CheckConstraint('end_time > start_time', name='ck_shows_end_after_start'),
+		ExcludeConstraint(('venue_id', '='), (db.func.tstzrange(start_time, end_time), '&&'),
+			name='ex_shows_venue_overlap', using='gist').ddl_if(dialect='postgresql'),
+		ExcludeConstraint(('artist_id', '='), (db.func.tstzrange(start_time, end_time), '&&'),
+			name='ex_shows_artist_overlap', using='gist').ddl_if(dialect='postgresql'),
+	)
+
+	# Both helpers expect a query already filtered on venue_id or artist_id,
+	# so together with the start_time bound they are range scans on the
+	# composite indexes above.
+	@classmethod
+	def upcoming(cls, query, now=None):
+		return query.filter(cls.start_time > (now or utcnow())).order_by(cls.start_time)
+
+	@classmethod
+	def past(cls, query, now=None):
+		return query.filter(cls.start_time <= (now or utcnow())).order_by(cls.start_time.desc())
 
 	def __repr__(self):
 		return f'<Show {self.id}>'
 
-# Seed Examples
-
-venue = Venue(
-  id=1,
-  name="The Musical Hop",
-  genres=["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-  city="San Francisco",
-  state="CA",
-  address="1015 Folsom Street",
-  phone="123-123-1234",
-  website="https://www.themusicalhop.com",
-  facebook_link="https://www.facebook.com/TheMusicalHop",
-  seeking_talent=True,
-  seeking_description="We are on the lookout for a local artist to play every two weeks. Please call us.",
-  image_link="https://emojipedia-us.s3.dualstack.us-west-1.amazonaws.com/socialmedia/apple/237/rabbit_1f407.png",
-  num_past_shows=1,
-  num_upcoming_shows=0)
-
-artist = Artist(
-  id=1,
-  name="Hello World",
-  genres=["Rock n Roll"],
-  city="San Francisco",
-  state="CA",
-  phone="326-123-5000",
-  website="https://www.helloworld.com",
-  facebook_link="https://www.facebook.com/helloworld",
-  seeking_venue=True,
-  seeking_description="Looking for shows to perform at in the San Francisco Bay Area!",
-  image_link="https://i.ytimg.com/vi/7U7Eu8u_tBw/maxresdefault.jpg",
-  num_past_shows=1,
-  num_upcoming_shows=0)
-
-show = Show(
-  venue_id=1,  
-  artist_id=1,
-  start_time="2019-05-21T21:30:00.000Z")
-
-def clear_data(session):
-  meta = db.metadata
-  for table in reversed(meta.sorted_tables):
-      print('Clear table %s' % table)
-      session.execute(table.delete())
-  session.commit()
-
-clear_data(db.session)
-db.session.add_all([venue, artist, show])
-db.session.commit()
-db.session.close()
\ No newline at end of file
+# Needed for the integer `=` part of the exclusion constraints.
+event.listen(Show.__table__, 'before_create',
+	DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql'))
+
+class ShowRollover(db.Model):
+	__tablename__ = 'show_rollovers'
+
+	# A single row: the instant up to which the num_past_shows and
+	# num_upcoming_shows counters have been rolled over (see counters.py).
+	id = db.Column(db.Integer, primary_key=True)
+	rolled_over_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+	def __repr__(self):
+		return f'<ShowRollover {self.rolled_over_at}>'
+
+class Job(db.Model):
+	__tablename__ = 'jobs'
+
+	# Durable queue for tasks.py.  At most one pending job per (name, key);
+	# done jobs are deleted, failed ones stay for inspection.
+	id = db.Column(db.Integer, primary_key=True)
+	name = db.Column(db.String(64), nullable=False)
+	key = db.Column(db.String(255), nullable=False, default='')
+	payload = db.Column(db.Text(), nullable=False, default='{}')
+	status = db.Column(db.String(16), nullable=False, default='pending')
+	attempts = db.Column(db.Integer(), nullable=False, default=0)
+	run_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+	locked_at = db.Column(db.DateTime(timezone=True))
+	last_error = db.Column(db.Text())
+	created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+	__table_args__ = (
+		db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+		db.Index('uq_jobs_pending_name_key', 'name', 'key', unique=True,
+			postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+	)
+
+	def __repr__(self):
+		return f'<Job {self.id} {self.name} {self.key} {self.status}>'
+
+class FacetCount(db.Model):
+	__tablename__ = 'facet_counts'
+
+	# Venues or artists per (genre, state, city, seeking) combination, '*'
+	# meaning any value (see facets.py).  NULL state/city are stored as ''.
+	kind = db.Column(db.String(16), primary_key=True)
+	genre = db.Column(db.String(120), primary_key=True)
+	state = db.Column(db.String(120), primary_key=True)
+	city = db.Column(db.String(120), primary_key=True)
+	seeking = db.Column(db.String(5), primary_key=True)
+	count = db.Column(db.Integer, nullable=False, default=0)
+
+	def __repr__(self):
+		return f'<FacetCount {self.kind} {self.genre} {self.state} {self.city} {self.seeking}: {self.count}>'
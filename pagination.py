@@ -0,0 +1,97 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import DateTime, tuple_
+
+# Keyset (cursor) pagination.
+#
+# A cursor is the sort key of the first or last row of a page, encoded as
+# url-safe base64 JSON.  Fetching the next page is a row-value comparison
+# against that key on an index that covers the sort columns, so deep pages
+# cost the same as the first one.
+
+class InvalidCursor(ValueError):
+  pass
+
+class KeysetPage:
+  def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=None):
+    self.items = items
+    self.next_cursor = next_cursor
+    self.prev_cursor = prev_cursor
+    self.per_page = per_page
+
+  def __iter__(self):
+    return iter(self.items)
+
+  def to_dict(self, serialize):
+    return {
+      "data": [serialize(item) for item in self.items],
+      "next_cursor": self.next_cursor,
+      "prev_cursor": self.prev_cursor,
+      "per_page": self.per_page,
+    }
+
+def encode_cursor(values):
+  values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+  raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, columns):
+  try:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    values = json.loads(raw.decode('utf-8'))
+    if not isinstance(values, list) or len(values) != len(columns):
+      raise InvalidCursor(cursor)
+    return [
+      datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+      for value, column in zip(values, columns)
+    ]
+  except (ValueError, TypeError) as e:
+    raise InvalidCursor(cursor) from e
+
+def page_size(requested, default, maximum):
+  try:
+    size = int(requested) if requested else default
+  except (TypeError, ValueError):
+    size = default
+  return max(1, min(size, maximum))
+
+def paginate(query, sort_columns, per_page, after=None, before=None):
+  # sort_columns are ascending and must end with a unique column (usually the
+  # primary key) so that the order is total and no row is skipped or repeated.
+  def key(row):
+    return encode_cursor([getattr(row, column.key) for column in sort_columns])
+
+  sort_key = tuple_(*sort_columns)
+  if before:
+    values = decode_cursor(before, sort_columns)
+    rows = (query.filter(sort_key < tuple_(*values))
+      .order_by(*[column.desc() for column in sort_columns])
+      .limit(per_page + 1)
+      .all())
+    has_more = len(rows) > per_page
+    items = list(reversed(rows[:per_page]))
+    return KeysetPage(
+      items,
+      next_cursor=key(items[-1]) if items else None,
+      prev_cursor=key(items[0]) if items and has_more else None,
+      per_page=per_page)
+
+  if after:
+    query = query.filter(sort_key > tuple_(*decode_cursor(after, sort_columns)))
+  rows = query.order_by(*sort_columns).limit(per_page + 1).all()
+  has_more = len(rows) > per_page
+  items = rows[:per_page]
+  return KeysetPage(
+    items,
+    next_cursor=key(items[-1]) if items and has_more else None,
+    prev_cursor=key(items[0]) if items and after else None,
+    per_page=per_page)
+
+def stream(query, sort_columns, batch_size, after=None):
+  # Same ordering as paginate() but without a page limit.  yield_per fetches
+  # rows in batches (through a server-side cursor where the driver supports
+  # one), so memory stays flat however many rows follow the cursor.
+  if after:
+    query = query.filter(tuple_(*sort_columns) > tuple_(*decode_cursor(after, sort_columns)))
+  return query.order_by(*sort_columns).yield_per(batch_size)
@@ -0,0 +1,85 @@
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import false, func, select, true, union_all
+from models import db, Artist, Genre, Show, Venue, artist_genres, venue_genres, utcnow
+
+# Read-only data for the venue and artist detail pages, in two queries:
+#
+#   1. the entity's columns, outer-joined to its genres (one row per genre),
+#      with its upcoming and past show counts;
+#   2. its upcoming shows and its DETAIL_PAST_SHOWS_LIMIT most recent past
+#      ones, through Show.upcoming and Show.past, joined to the venue or
+#      artist on the other side.
+#
+# Both sides of the split are range scans on the shows (venue_id,
+# start_time) and (artist_id, start_time) indexes, and the past side is
+# bounded, so an entity with years of history costs no more than a new one.
+# The result is a namedtuple of plain values, with the shows as Row tuples,
+# so nothing a template touches can lazy-load and nothing can be written
+# back.  The shows carry the updated_at columns the tile cache keys on (see
+# templating.py).
+
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'phone', 'website', 'facebook_link',
+  'seeking_talent', 'seeking_description', 'image_link')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'website', 'facebook_link',
+  'seeking_venue', 'seeking_description', 'image_link')
+SHOW_LISTS = ('genres', 'upcoming_shows', 'past_shows', 'upcoming_shows_count', 'past_shows_count')
+
+VenueDetail = namedtuple('VenueDetail', VENUE_FIELDS + SHOW_LISTS)
+ArtistDetail = namedtuple('ArtistDetail', ARTIST_FIELDS + SHOW_LISTS)
+GenreName = namedtuple('GenreName', ('id', 'name'))
+
+def show_count(helper, owner_column, model, now):
+  # Counted off the index alone; the helper's ORDER BY has no place here.
+  return helper(select(func.count(Show.id)).where(owner_column == model.id), now).order_by(None).scalar_subquery()
+
+def entity_rows(model, fields, link_column, owner_column, entity_id, now):
+  link = link_column.table
+  return db.session.execute(select(*[getattr(model, field) for field in fields],
+      Genre.id.label('genre_id'), Genre.name.label('genre_name'),
+      show_count(Show.upcoming, owner_column, model, now).label('upcoming_count'),
+      show_count(Show.past, owner_column, model, now).label('past_count'))
+    .outerjoin(link, link_column == model.id)
+    .outerjoin(Genre, Genre.id == link.c.genre_id)
+    .where(model.id == entity_id)
+    .order_by(Genre.name)).all()
+
+def show_rows(owner_column, counterpart, counterpart_column, prefix, entity_id, now, past_limit):
+  shows = (select(
+      Show.id,
+      Show.start_time,
+      counterpart_column,
+      counterpart.name.label(f'{prefix}_name'),
+      counterpart.image_link.label(f'{prefix}_image_link'),
+      Show.updated_at,
+      counterpart.updated_at.label(f'{prefix}_updated_at'))
+    .join(counterpart, counterpart.id == counterpart_column)
+    .where(owner_column == entity_id))
+  upcoming = Show.upcoming(shows, now).order_by(Show.id).subquery()
+  past = Show.past(shows, now).order_by(Show.id.desc()).limit(past_limit).subquery()
+  return db.session.execute(union_all(
+      select(upcoming, true().label('upcoming')),
+      select(past, false().label('upcoming')))
+    .order_by('start_time', 'id')).all()
+
+def split_shows(shows):
+  # Upcoming soonest first, past most recent first.
+  return (tuple(show for show in shows if show.upcoming),
+    tuple(show for show in reversed(shows) if not show.upcoming))
+
+def detail(record, model, fields, link_column, shows, entity_id, now):
+  now = now or utcnow()
+  rows = entity_rows(model, fields, link_column, shows[0], entity_id, now)
+  if not rows:
+    return None
+  upcoming, past = split_shows(show_rows(*shows, entity_id, now, current_app.config['DETAIL_PAST_SHOWS_LIMIT']))
+  genres = tuple(GenreName(row.genre_id, row.genre_name) for row in rows if row.genre_id is not None)
+  return record(*rows[0][:len(fields)], genres, upcoming, past, rows[0].upcoming_count, rows[0].past_count)
+
+def venue_detail(venue_id, now=None):
+  return detail(VenueDetail, Venue, VENUE_FIELDS, venue_genres.c.venue_id,
+    (Show.venue_id, Artist, Show.artist_id, 'artist'), venue_id, now)
+
+def artist_detail(artist_id, now=None):
+  return detail(ArtistDetail, Artist, ARTIST_FIELDS, artist_genres.c.artist_id,
+    (Show.artist_id, Venue, Show.venue_id, 'venue'), artist_id, now)
@@ -0,0 +1,127 @@
+import threading
+import time
+from itertools import count
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.dml import UpdateBase
+
+# Read-replica routing.
+#
+# GET and HEAD requests read from a replica picked round-robin among the ones
+# that passed their last health check; everything else, the CLI, and any
+# flush or INSERT/UPDATE/DELETE goes to the primary.  A client that has just
+# committed a write keeps reading from the primary for
+# REPLICA_READ_YOUR_WRITES_SECONDS so it never sees its own change missing.
+# With no replicas configured the session behaves exactly like
+# Flask-SQLAlchemy's.
+#
+# The write time is kept in the Flask session, and reading the session adds
+# `Vary: Cookie` to the response, so the router only looks at it for GET and
+# HEAD on non-static endpoints and only sets it on unsafe methods: static
+# files, assets and cached pages stay shareable by proxies and CDNs.
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+SESSION_METHODS = ('GET', 'HEAD')
+STATIC_ENDPOINTS = ('static', 'assets')
+
+# PostgreSQL standby lag; zero when it has replayed everything it received,
+# so an idle primary doesn't make its replicas look stale.
+LAG_QUERY = text(
+  "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+  "ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+class RoutingSession(Session):
+  def get_bind(self, mapper=None, clause=None, **kwargs):
+    if not self._flushing and not isinstance(clause, UpdateBase) and reading():
+      engine = replica_engine()
+      if engine is not None:
+        return engine
+    return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def committed(session):
+  if has_request_context():
+    g.committed = True
+
+def reading():
+  return has_request_context() and g.get('read_only', False)
+
+def replica_engine():
+  # One replica per request, so every query in it sees the same snapshot.
+  if 'replica_engine' not in g:
+    router = current_app.extensions.get('replicas')
+    g.replica_engine = router.choose() if router is not None else None
+  return g.replica_engine
+
+class Replica:
+  def __init__(self, engine):
+    self.engine = engine
+    self.healthy = True
+    self.checked_at = float('-inf')
+    self.lock = threading.Lock()
+
+  def available(self, interval, max_lag):
+    if time.monotonic() - self.checked_at >= interval:
+      with self.lock:
+        if time.monotonic() - self.checked_at >= interval:
+          self.healthy = self.check(max_lag)
+          self.checked_at = time.monotonic()
+    return self.healthy
+
+  def check(self, max_lag):
+    try:
+      with self.engine.connect() as connection:
+        if self.engine.dialect.name == 'postgresql':
+          return connection.execute(LAG_QUERY).scalar() <= max_lag
+        connection.execute(text('SELECT 1'))
+        return True
+    except SQLAlchemyError:
+      return False
+
+class ReplicaRouter:
+  def __init__(self, app=None):
+    self.replicas = []
+    self.counter = count()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_HEALTH_INTERVAL', 10)
+    app.config.setdefault('REPLICA_MAX_LAG_SECONDS', 30)
+    app.config.setdefault('REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+    self.health_interval = app.config['REPLICA_HEALTH_INTERVAL']
+    self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+    self.read_your_writes = app.config['REPLICA_READ_YOUR_WRITES_SECONDS']
+    # Replicas share the primary's pool settings.
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    self.replicas = [Replica(create_engine(uri, **options)) for uri in app.config['SQLALCHEMY_REPLICA_URIS']]
+    app.extensions['replicas'] = self
+    app.before_request(self.route_request)
+    app.after_request(self.remember_write)
+
+  def engines(self):
+    return [replica.engine for replica in self.replicas]
+
+  def choose(self):
+    for _ in range(len(self.replicas)):
+      replica = self.replicas[next(self.counter) % len(self.replicas)]
+      if replica.available(self.health_interval, self.max_lag):
+        return replica.engine
+    return None
+
+  def route_request(self):
+    g.read_only = False
+    if not self.replicas or request.method not in READ_METHODS:
+      return
+    if request.method in SESSION_METHODS and request.endpoint not in STATIC_ENDPOINTS:
+      if time.time() - session.get('_last_write', 0) < self.read_your_writes:
+        return
+    g.read_only = True
+
+  def remember_write(self, response):
+    if self.replicas and request.method not in READ_METHODS and g.get('committed', False):
+      session['_last_write'] = time.time()
+    return response
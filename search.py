@@ -0,0 +1,95 @@
+import re
+from sqlalchemy import case, func, literal_column, select, union
+from models import db
+from genres import filter_by_genres, genre_facets, with_genre_matching
+
+# Search over venues and artists.
+#
+# On PostgreSQL the filters below line up with the indexes created by the
+# "search indexes" migration: a GIN tsvector index over name and city,
+# GIN trigram indexes on name and city (which also serve ILIKE '%term%'), and a
+# lower(name) text_pattern_ops index for prefix autocomplete.  Other dialects
+# fall back to plain ILIKE matching so the app still works on SQLite.
+#
+# Genres live in link tables (see genres.py), so they match on every dialect
+# through the genre names: the handful of rows in `genres` are checked
+# against the term, and the (genre_id, owner) link index finds their venues
+# or artists.  A genre match adds nothing to the rank.
+
+TEXT_SEARCH_CONFIG = literal_column("'simple'::regconfig")
+SPACE = literal_column("' '")
+EMPTY = literal_column("''")
+
+def like_escape(term):
+  return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def is_postgresql():
+  return db.session.get_bind().dialect.name == 'postgresql'
+
+def search_document(model):
+  # Must stay identical to the expression indexed in the migration.
+  return func.to_tsvector(
+    TEXT_SEARCH_CONFIG,
+    func.coalesce(model.name, EMPTY).concat(SPACE).concat(func.coalesce(model.city, EMPTY)))
+
+def prefix_tsquery(search_term):
+  words = re.findall(r'\w+', search_term)
+  if not words:
+    return None
+  return func.to_tsquery(TEXT_SEARCH_CONFIG, ' & '.join(word + ':*' for word in words))
+
+def text_or_genre(model, condition, genre_owners):
+  # A UNION of the two id lists rather than `condition OR id IN (...)`: the
+  # OR would keep PostgreSQL from combining the text indexes.
+  return model.id.in_(union(select(model.id).where(condition), genre_owners))
+
+def match_and_rank(model, search_term):
+  pattern = '%' + like_escape(search_term) + '%'
+  prefix = like_escape(search_term.lower()) + '%'
+  substring_match = model.name.ilike(pattern, escape='\\')
+  genre_owners = with_genre_matching(model, pattern)
+  prefix_rank = case((func.lower(model.name).like(prefix, escape='\\'), 1), else_=0)
+  if not is_postgresql():
+    return text_or_genre(model, substring_match, genre_owners), prefix_rank
+  query = prefix_tsquery(search_term)
+  if query is None:
+    return text_or_genre(model, substring_match, genre_owners), prefix_rank
+  document = search_document(model)
+  condition = text_or_genre(model,
+    document.op('@@')(query) | substring_match | model.name.op('%')(search_term), genre_owners)
+  rank = func.ts_rank(document, query) + func.similarity(model.name, search_term) + prefix_rank
+  return condition, rank
+
+def search_with_upcoming_shows(model, search_term, limit, genres=()):
+  # num_upcoming_shows is the counter maintained by counters.py, so this is
+  # a single scan of the matching rows with no join against shows.
+  # COUNT() OVER () reports the total number of matches even though only
+  # `limit` rows come back.
+  condition, rank = match_and_rank(model, search_term)
+  query = (db.session.query(
+      model.id,
+      model.name,
+      model.num_upcoming_shows,
+      func.count().over().label('total'))
+    .filter(condition))
+  rows = (filter_by_genres(query, model, genres)
+    .order_by(rank.desc(), model.name, model.id)
+    .limit(limit)
+    .all())
+  data = [{"id": row.id, "name": row.name, "num_upcoming_shows": row.num_upcoming_shows} for row in rows]
+  return {
+    "count": rows[0].total if rows else 0,
+    "data": data,
+    "facets": genre_facets(model, condition, genres),
+  }
+
+def autocomplete(model, prefix, limit):
+  prefix = prefix.strip().lower()
+  if not prefix:
+    return []
+  rows = (db.session.query(model.id, model.name)
+    .filter(func.lower(model.name).like(like_escape(prefix) + '%', escape='\\'))
+    .order_by(func.lower(model.name), model.id)
+    .limit(limit)
+    .all())
+  return [{"id": row.id, "name": row.name} for row in rows]
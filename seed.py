@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+import click
+from flask.cli import with_appcontext
+from counters import recount_shows
+from facets import rebuild_facets
+from models import db, Artist, Genre, Show, Venue
+
+# Example data, loaded on demand with `flask seed` instead of on every
+# import of models.py.
+
+def example_rows():
+  venue = Venue(
+    id=1,
+    name="The Musical Hop",
+    genres=Genre.named(["Jazz", "Reggae", "Swing", "Classical", "Folk"]),
+    city="San Francisco",
+    state="CA",
+    address="1015 Folsom Street",
+    phone="123-123-1234",
+    website="https://www.themusicalhop.com",
+    facebook_link="https://www.facebook.com/TheMusicalHop",
+    seeking_talent=True,
+    seeking_description="We are on the lookout for a local artist to play every two weeks. Please call us.",
+    image_link="https://emojipedia-us.s3.dualstack.us-west-1.amazonaws.com/socialmedia/apple/237/rabbit_1f407.png")
+
+  artist = Artist(
+    id=1,
+    name="Hello World",
+    genres=Genre.named(["Rock n Roll"]),
+    city="San Francisco",
+    state="CA",
+    phone="326-123-5000",
+    website="https://www.helloworld.com",
+    facebook_link="https://www.facebook.com/helloworld",
+    seeking_venue=True,
+    seeking_description="Looking for shows to perform at in the San Francisco Bay Area!",
+    image_link="https://i.ytimg.com/vi/7U7Eu8u_tBw/maxresdefault.jpg")
+
+  show = Show(
+    venue_id=1,
+    artist_id=1,
+    start_time=datetime(2019, 5, 21, 21, 30, tzinfo=timezone.utc))
+
+  return [venue, artist, show]
+
+def clear_data(session):
+  meta = db.metadata
+  for table in reversed(meta.sorted_tables):
+      click.echo('Clear table %s' % table)
+      session.execute(table.delete())
+  session.commit()
+
+@click.command('seed')
+@click.confirmation_option(prompt='This deletes every venue, artist and show. Continue?')
+@with_appcontext
+def seed_command():
+  """Replace the database contents with the example venue, artist and show."""
+  clear_data(db.session)
+  db.session.add_all(example_rows())
+  db.session.commit()
+  # Sets the counters, the rollover watermark and the facet counts from the
+  # rows just added.
+  recount_shows()
+  rebuild_facets()
+  click.echo('Seeded example data')
@@ -2,3 +2,38 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Prefix suggestions for the navbar search box, fed by the JSON
+// /venues/autocomplete and /artists/autocomplete endpoints.
+document.addEventListener('DOMContentLoaded', function() {
+  var input = document.querySelector('input[data-autocomplete]');
+  if (!input || !window.fetch) {
+    return;
+  }
+  var list = document.getElementById(input.getAttribute('list'));
+  var timer = null;
+  var lastQuery = '';
+  input.addEventListener('input', function() {
+    clearTimeout(timer);
+    timer = setTimeout(function() {
+      var q = input.value.trim();
+      if (!q || q === lastQuery) {
+        return;
+      }
+      lastQuery = q;
+      fetch(input.getAttribute('data-autocomplete') + '?q=' + encodeURIComponent(q))
+        .then(function(response) { return response.json(); })
+        .then(function(body) {
+          if (q !== lastQuery) {
+            return;
+          }
+          list.innerHTML = '';
+          body.data.forEach(function(item) {
+            var option = document.createElement('option');
+            option.value = item.name;
+            list.appendChild(option);
+          });
+        });
+    }, 150);
+  });
+});
@@ -0,0 +1,254 @@
+import json
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Job, utcnow
+from routing import RoutingSession
+
+# Background work that doesn't have to hold up a response.
+#
+#   @tasks.task('rebuild-facets')
+#   def rebuild(kinds): ...
+#
+#   tasks.enqueue('rebuild-facets', key='venues', kinds=['venues'])
+#
+# Jobs are attached to the current session and only dispatched once it
+# commits, so work derived from a write never runs (or is stored) for a write
+# that rolled back.  Enqueueing a job whose (name, key) is already waiting is
+# a no-op.  Failed jobs are retried with exponential backoff up to
+# TASKS_MAX_ATTEMPTS.
+#
+# TASKS_BACKEND picks where they run:
+#   'thread'    a pool of TASKS_WORKERS threads in the web process; jobs are
+#               lost if the process exits before they finish.
+#   'database'  rows in the jobs table, committed with the write, run by
+#               `flask worker` (several workers can share the table).
+#   'inline'    right after the commit, on the same thread; for the CLI and
+#               tests.
+
+log = logging.getLogger(__name__)
+
+class TaskQueue:
+  def __init__(self, app=None):
+    self.registry = {}
+    self.backend = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('TASKS_BACKEND', 'thread')
+    app.config.setdefault('TASKS_WORKERS', 4)
+    app.config.setdefault('TASKS_MAX_ATTEMPTS', 5)
+    app.config.setdefault('TASKS_RETRY_DELAY', 2)
+    app.config.setdefault('TASKS_LOCK_TIMEOUT', 600)
+    backend = app.config['TASKS_BACKEND']
+    if backend == 'thread':
+      self.backend = ThreadBackend(self, app)
+    elif backend == 'database':
+      self.backend = DatabaseBackend(self, app)
+    elif backend == 'inline':
+      self.backend = InlineBackend(self, app)
+    else:
+      raise ValueError(f'Unknown TASKS_BACKEND {backend!r}')
+    app.extensions['tasks'] = self
+
+  def task(self, name):
+    def decorator(function):
+      self.registry[name] = function
+      return function
+    return decorator
+
+  def enqueue(self, name, key='', **kwargs):
+    if name not in self.registry:
+      raise KeyError(f'Unknown task {name!r}')
+    job = {"name": name, "key": str(key), "payload": kwargs}
+    if isinstance(self.backend, DatabaseBackend):
+      self.backend.store(job)
+    else:
+      pending = db.session.info.setdefault('tasks', {})
+      pending.setdefault((name, job['key']), job)
+
+  def run(self, job):
+    # Returns None on success or the formatted exception.
+    try:
+      self.registry[job['name']](**job['payload'])
+      db.session.commit()
+    except Exception:
+      db.session.rollback()
+      return traceback.format_exc()
+    finally:
+      db.session.remove()
+
+  def retry_delay(self, app, attempts):
+    return app.config['TASKS_RETRY_DELAY'] * 2 ** (attempts - 1)
+
+# Bound to the application in app.create_app(); modules register their
+# jobs on it at import time.
+tasks = TaskQueue()
+
+@event.listens_for(RoutingSession, 'after_commit')
+def dispatch(session):
+  jobs = session.info.pop('tasks', None)
+  if jobs:
+    backend = current_app.extensions['tasks'].backend
+    for job in jobs.values():
+      backend.submit(job)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard(session):
+  session.info.pop('tasks', None)
+
+class InlineBackend:
+  def __init__(self, tasks, app):
+    self.tasks = tasks
+    self.app = app
+
+  def submit(self, job):
+    # Runs on a fresh app context, so the job gets its own session rather
+    # than the one whose commit is still being wrapped up.
+    for attempt in range(1, self.app.config['TASKS_MAX_ATTEMPTS'] + 1):
+      with self.app.app_context():
+        error = self.tasks.run(job)
+      if error is None:
+        return
+      log.warning('Task %s(%s) failed, attempt %d:\n%s', job['name'], job['key'], attempt, error)
+
+class ThreadBackend:
+  def __init__(self, tasks, app):
+    self.tasks = tasks
+    self.app = app
+    self.executor = None
+    self.queued = set()
+    self.lock = threading.Lock()
+
+  def submit(self, job, attempts=0):
+    ident = (job['name'], job['key'])
+    with self.lock:
+      if attempts == 0 and ident in self.queued:
+        return
+      self.queued.add(ident)
+      if self.executor is None:
+        # Created on first use, so a preloaded gunicorn master doesn't
+        # fork with live threads.
+        self.executor = ThreadPoolExecutor(self.app.config['TASKS_WORKERS'], thread_name_prefix='task')
+    self.executor.submit(self.work, job, attempts + 1)
+
+  def work(self, job, attempts):
+    with self.lock:
+      # From here on a new enqueue of the same job runs again: this run may
+      # already have read the data that changed.
+      self.queued.discard((job['name'], job['key']))
+    with self.app.app_context():
+      error = self.tasks.run(job)
+    if error is None:
+      return
+    if attempts >= self.app.config['TASKS_MAX_ATTEMPTS']:
+      log.error('Task %s(%s) failed after %d attempts:\n%s', job['name'], job['key'], attempts, error)
+      return
+    log.warning('Task %s(%s) failed, retrying:\n%s', job['name'], job['key'], error)
+    timer = threading.Timer(self.tasks.retry_delay(self.app, attempts), self.submit, (job, attempts))
+    timer.daemon = True
+    timer.start()
+
+  def shutdown(self, wait=True):
+    if self.executor is not None:
+      self.executor.shutdown(wait=wait)
+      self.executor = None
+
+class DatabaseBackend:
+  def __init__(self, tasks, app):
+    self.tasks = tasks
+    self.app = app
+
+  def store(self, job):
+    # Part of the caller's transaction; a pending duplicate absorbs it.
+    dialect = db.session.get_bind().dialect.name
+    statement = (postgresql if dialect == 'postgresql' else sqlite).insert(Job).values(
+      name=job['name'], key=job['key'], payload=json.dumps(job['payload']),
+      status='pending', attempts=0, run_at=utcnow(), created_at=utcnow())
+    db.session.execute(statement.on_conflict_do_nothing(
+      index_elements=['name', 'key'], index_where=Job.status == 'pending'))
+
+  def claim(self, limit):
+    # SKIP LOCKED lets several workers poll the same table; on SQLite the
+    # UPDATE's status check does the same job, since writes are serialized.
+    now = utcnow()
+    stale = now - timedelta(seconds=self.app.config['TASKS_LOCK_TIMEOUT'])
+    ids = db.session.scalars(select(Job.id)
+      .where(or_(Job.status == 'pending', (Job.status == 'running') & (Job.locked_at < stale)), Job.run_at <= now)
+      .order_by(Job.run_at, Job.id)
+      .limit(limit)
+      .with_for_update(skip_locked=True)).all()
+    claimed = []
+    for id in ids:
+      result = db.session.execute(update(Job)
+        .where(Job.id == id, or_(Job.status == 'pending', Job.locked_at < stale))
+        .values(status='running', locked_at=now, attempts=Job.attempts + 1))
+      if result.rowcount:
+        claimed.append(id)
+    db.session.commit()
+    return db.session.execute(select(Job.id, Job.name, Job.key, Job.payload, Job.attempts)
+      .where(Job.id.in_(claimed))).all() if claimed else []
+
+  def finish(self, row, error):
+    if error is None:
+      db.session.execute(delete(Job).where(Job.id == row.id))
+    elif row.attempts >= self.app.config['TASKS_MAX_ATTEMPTS']:
+      db.session.execute(update(Job).where(Job.id == row.id).values(status='failed', locked_at=None, last_error=error))
+    else:
+      # Back in line, unless an identical job was queued while this ran.
+      retry_at = utcnow() + timedelta(seconds=self.tasks.retry_delay(self.app, row.attempts))
+      pending = db.session.scalar(select(Job.id).where(Job.name == row.name, Job.key == row.key, Job.status == 'pending'))
+      if pending is None:
+        db.session.execute(update(Job).where(Job.id == row.id)
+          .values(status='pending', locked_at=None, run_at=retry_at, last_error=error))
+      else:
+        db.session.execute(delete(Job).where(Job.id == row.id))
+    db.session.commit()
+
+  def work(self, batch_size):
+    # One polling round; returns the number of jobs run.
+    rows = self.claim(batch_size)
+    for row in rows:
+      job = {"name": row.name, "key": row.key, "payload": json.loads(row.payload)}
+      if job['name'] not in self.tasks.registry:
+        error = f"Unknown task {job['name']!r}"
+      else:
+        error = self.tasks.run(job)
+      if error is not None:
+        log.warning('Task %s(%s) failed, attempt %d:\n%s', row.name, row.key, row.attempts, error)
+      self.finish(row, error)
+    return len(rows)
+
+  def submit(self, job):
+    # Already stored with the transaction that just committed.
+    pass
+
+@click.command('worker')
+@click.option('--batch-size', default=10, show_default=True, help='Jobs claimed per polling round.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--once', is_flag=True, help='Run what is due now, then exit.')
+@with_appcontext
+def worker_command(batch_size, poll_interval, once):
+  """Run jobs from the jobs table (TASKS_BACKEND = 'database')."""
+  tasks = current_app.extensions['tasks']
+  backend = tasks.backend
+  if not isinstance(backend, DatabaseBackend):
+    backend = DatabaseBackend(tasks, current_app)
+  total = 0
+  while True:
+    done = backend.work(batch_size)
+    total += done
+    if once and not done:
+      break
+    if not done:
+      time.sleep(poll_interval)
+  click.echo(f'Ran {total} jobs')
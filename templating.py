@@ -0,0 +1,85 @@
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from cache import MemoryBackend
+
+# Template compilation and fragment caching.
+#
+# Compiled templates are written to a FileSystemBytecodeCache, so a worker,
+# or the next deploy, loads bytecode instead of parsing and compiling the
+# source again.  The cached bytecode is executed, so by default it lives in
+# Jinja's per-user directory (mode 0700, owner checked).
+# TEMPLATE_BYTECODE_CACHE can name another directory, which must not be
+# writable by anyone else, or be empty to turn the cache off.
+#
+# compile_templates() loads every template up front; wsgi.py runs it at
+# import, so a preloaded gunicorn master compiles once and the workers
+# inherit the result.
+#
+# The {% cache %} tag keeps a rendered fragment in an in-process LRU:
+#
+#   {% cache 'venue-show', show.id, show.updated_at, show.artist_updated_at %}
+#     ...
+#   {% endcache %}
+#
+# The key is the tag's arguments joined together, so it has to include a
+# version for everything the fragment shows: a changed row gets a new key
+# rather than an invalidation.  Entries expire after FRAGMENT_CACHE_TTL,
+# which bounds how long a change made outside the app (no updated_at bump)
+# can go unnoticed.  FRAGMENT_CACHE_MAX_ENTRIES = 0 renders every time.
+
+class FragmentCacheExtension(Extension):
+  tags = {'cache'}
+
+  def __init__(self, environment):
+    super().__init__(environment)
+    environment.extend(fragment_cache=None, fragment_cache_ttl=0)
+
+  def parse(self, parser):
+    lineno = next(parser.stream).lineno
+    parts = [parser.parse_expression()]
+    while parser.stream.skip_if('comma'):
+      parts.append(parser.parse_expression())
+    body = parser.parse_statements(('name:endcache',), drop_needle=True)
+    return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+  def _render(self, parts, caller):
+    backend = self.environment.fragment_cache
+    if backend is None:
+      return caller()
+    key = '\x1f'.join(map(str, parts))
+    value = backend.get(key)
+    if value is None:
+      value = caller()
+      backend.set(key, str(value), self.environment.fragment_cache_ttl, ())
+    return Markup(value)
+
+class Templating:
+  def __init__(self, app=None):
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE', None)
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+    app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+    env = app.jinja_env
+    directory = app.config['TEMPLATE_BYTECODE_CACHE']
+    if directory is None:
+      env.bytecode_cache = FileSystemBytecodeCache()
+    elif directory:
+      os.makedirs(directory, mode=0o700, exist_ok=True)
+      env.bytecode_cache = FileSystemBytecodeCache(directory)
+    env.add_extension(FragmentCacheExtension)
+    if app.config['FRAGMENT_CACHE_MAX_ENTRIES']:
+      env.fragment_cache = MemoryBackend(app.config['FRAGMENT_CACHE_MAX_ENTRIES'])
+      env.fragment_cache_ttl = app.config['FRAGMENT_CACHE_TTL']
+    app.extensions['templating'] = self
+
+def compile_templates(app):
+  # Returns the number of templates loaded.
+  names = app.jinja_env.list_templates(extensions=['html'])
+  for name in names:
+    app.jinja_env.get_template(name)
+  return len(names)
@@ -0,0 +1,18 @@
+import os
+from app import create_app
+from database import warm_up
+from templating import compile_templates
+
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# gunicorn.conf.py warms each worker after fork.  Other servers that import
+# this module once per worker (uWSGI with lazy-apps, waitress) can set
+# WSGI_WARMUP=1 to do the same at import time.
+
+app = create_app()
+# Before any fork: a preloaded master compiles the templates once for all
+# its workers, and fills the bytecode cache for the next start.
+compile_templates(app)
+
+if os.environ.get('WSGI_WARMUP') == '1':
+  warm_up(app)